@@ -0,0 +1,291 @@
+"""
+Engine for computing aggregates over the data in parallel. An aggregate is registered with
+a partial function, that computes the aggregate of a partition of the rows, and a merge
+function, that combines the results of all the partitions. The engine splits the data in
+as many partitions as the machine and the data allow, runs each of them on the worker pool
+and merges the results.
+    -partial(batches, *args): Receives an iterator of 2D arrays (rows x variables) with the
+                              rows of the partition; returns the partial result.
+    -merge(results): Receives the list of partial results; returns the aggregate.
+Several aggregates can be computed together with a single pass over the data (see
+computeMany), each one receiving its own variables of every block of rows.
+The functions must be defined at module level, so they can be sent to the workers. When
+the partial results have a fixed size (e.g. counts or sums), the workers write them on a
+block of shared memory instead of sending them back; so do several aggregates computed
+together, when all of them have a fixed size.
+"""
+import numpy as np
+
+# Workers for the partitions
+import workerPool as wP
+# Statistics of each variable
+import columnStats as cS
+# Results on shared memory
+import sharedArrays as sA
+
+# Registered aggregates, as (partial, merge, shape, dtype) by name
+aggregates = {}
+
+# Minimum number of rows of a partition, smaller data is not worth splitting
+minPartitionRows = 1 << 15
+
+def register(name, partial, merge, shape=None, dtype=np.float64):
+    """ Registers the aggregate 'name'.
+        -shape: For partial results of fixed size, function returning the shape of the result
+                from the arguments of the aggregate. For partial results made of a list of arrays,
+                it returns the list of (shape, dtype) of them instead; None if their size is
+                not fixed for those arguments.
+        -dtype: Type of the values of the partial results of fixed size.
+    """
+    aggregates[name] = (partial, merge, shape, dtype)
+
+def numberPartitions(data):
+    """ Returns the number of partitions for the data: one per worker, if the source can be
+    positioned at any row and each partition has at least minPartitionRows rows. """
+    nRow = data.getNumberRows()
+    if not data.isSeekable() or nRow <= 0:
+        return 1
+    return max(1, min(wP.getNumberWorkers(), nRow // minPartitionRows))
+
+def partitions(data):
+    """ Returns the list of [start, end) rows of the partitions of the data. The end is None when
+    the number of rows is unknown. """
+    nRow = data.getNumberRows()
+    if nRow <= 0:
+        return [(0, None)]
+    bounds = np.linspace(0, nRow, numberPartitions(data) + 1).astype(np.int64).tolist()
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+def resultLayout(name, args):
+    """ Returns the list of (shape, dtype) of the arrays of the partial result of the aggregate,
+    and if the result is a list of them (instead of a single array); None if its size is not fixed """
+    partial, merge, shape, dtype = aggregates[name]
+    layout = shape(*args) if shape is not None else None
+    if layout is None:
+        return None
+    if isinstance(layout, list):
+        return [(tuple(s), d) for s, d in layout], True
+    return [(tuple(layout), dtype)], False
+
+def compute(data, name, *args):
+    """ Returns the aggregate 'name' of the data (e.g. a projection of the data set) """
+    partial, merge, shape, dtype = aggregates[name]
+    if not data.isSeekable():
+        # The rows can only be read in order, from this process
+        cursor = data.cursor()
+        result = partial(cursor.iterBatches(), *args)
+        if cursor is not data:
+            # A stream is its own cursor, and stays open
+            cursor.close()
+        return merge([result])
+    bounds = partitions(data)
+    if len(bounds) == 1:
+        # Not worth sending to a worker
+        return merge([runPartition(partial, data.cursor(), bounds[0][0], bounds[0][1], args)])
+    layout = resultLayout(name, args)
+    if layout is None:
+        futures = []
+        for start, end in bounds:
+            futures.append(submitPartition(runPartition, partial, data, start, end, args))
+        return merge(wP.gather(futures))
+    layout, packed = layout
+    # One row of each array of the block for the result of each partition
+    block = sA.zeros([(len(bounds),) + s for s, d in layout], [d for s, d in layout])
+    try:
+        futures = []
+        for i in range(len(bounds)):
+            start, end = bounds[i]
+            futures.append(submitPartition(runSharedPartition, partial, data, start, end, args,
+                                           block.descriptor(), i, packed))
+        wP.gather(futures)
+        if packed:
+            results = [[array[i].copy() for array in block.arrays] for i in range(len(bounds))]
+        else:
+            results = [row.copy() for row in block.arrays[0]]
+    finally:
+        block.close()
+    return merge(results)
+
+def computeMany(data, requests):
+    """ Returns the list of results of several aggregates, computed with a single pass over the data.
+        -requests: List of (name, axes, args): the aggregate, the list of variables of the data it
+                   receives (in that order) and its arguments.
+    """
+    # Only the variables used by some aggregate are read
+    axes = sorted(set(axis for name, requestAxes, args in requests for axis in requestAxes))
+    specs = []
+    for name, requestAxes, args in requests:
+        partial, merge, shape, dtype = aggregates[name]
+        specs.append((partial, merge, [axes.index(axis) for axis in requestAxes], tuple(args), shape, dtype))
+    projection = data.project(axes)
+    try:
+        parts = compute(projection, 'fused', specs)
+    finally:
+        projection.close()
+    return [specs[i][1](parts[i]) for i in range(len(specs))]
+
+def submitPartition(function, partial, data, *args):
+    """ Sends function(partial, cursor, *args) to a worker, with a new cursor over the data. The
+    cursor is only sent from this process (the worker opens the file again), so it is closed
+    at once. """
+    cursor = data.cursor()
+    future = wP.submit(function, partial, cursor, *args)
+    cursor.close()
+    return future
+
+def runPartition(partial, data, startPosition, endPosition, args):
+    """ Computes the partial aggregate of the rows on [startPosition, endPosition) of the data """
+    data.setDataSetPosition(startPosition, endPosition)
+    maxRows = None if endPosition is None else endPosition - startPosition
+    try:
+        result = partial(data.iterBatches(maxRows=maxRows), *args)
+    finally:
+        data.close()
+    return result
+
+def runSharedPartition(partial, data, startPosition, endPosition, args, descriptor, index, packed):
+    """ Computes the partial aggregate of the rows on [startPosition, endPosition) of the data,
+    and writes it on the row 'index' of the shared block (of each of its arrays, if the result
+    is 'packed' as a list of arrays) """
+    result = runPartition(partial, data, startPosition, endPosition, args)
+    arrays = sA.attach(descriptor)
+    parts = result if packed else [result]
+    for i in range(len(parts)):
+        arrays[i][index] = parts[i]
+    sA.detach(descriptor)
+
+#---------------------------------------------------------------------------------------------
+# Aggregates of the data sets
+
+def statisticsPartial(batches, length):
+    """ Returns the statistics of the 'length' variables """
+    return cS.computeStatistics(batches, length)
+
+def histogramPartial(batches, edges):
+    """ Returns the number of values of the first variable on each of the classes delimited by 'edges' """
+    counts = np.zeros(len(edges) - 1, dtype=np.int64)
+    for batch in batches:
+        values = batch[:, 0]
+        counts += np.histogram(values[~np.isnan(values)], bins=edges)[0]
+    return counts
+
+def histogramShape(edges):
+    """ Returns the shape of the partial result of the histogram """
+    return (len(edges) - 1,)
+
+def pairHistogramPartial(batches, pairs, ranges, numBins, rowFilter):
+    """ Returns, for each pair (a, b) of variables on 'pairs', the number of rows on each of the
+    numBins x numBins classes of equal size that divide ranges[a] x ranges[b] (see
+    dataIterator.Data.getPairHistograms). The rows with a missing value on the pair, or out of
+    the range of 'rowFilter' ((variable, lower, upper), or None), are not counted. """
+    counts = np.zeros((len(pairs), numBins, numBins), dtype=np.int64)
+    for batch in batches:
+        rows = np.ones(len(batch), dtype=bool)
+        if rowFilter is not None:
+            column, lower, upper = rowFilter
+            rows &= (lower <= batch[:, column]) & (batch[:, column] <= upper)
+        # Class of each value of each variable, -1 for the missing values
+        classes = {}
+        for axis in set(axis for pair in pairs for axis in pair):
+            minR, maxR = ranges[axis]
+            scale = numBins / (maxR - minR) if maxR > minR else 0.0
+            values = batch[:, axis]
+            valid = ~np.isnan(values)
+            classes[axis] = np.full(len(batch), -1, dtype=np.int64)
+            classes[axis][valid] = np.clip(((values[valid] - minR) * scale).astype(np.int64), 0, numBins - 1)
+        for k in range(len(pairs)):
+            a, b = pairs[k]
+            valid = rows & (classes[a] >= 0) & (classes[b] >= 0)
+            cells = classes[a][valid] * numBins + classes[b][valid]
+            counts[k] += np.bincount(cells, minlength=numBins * numBins).reshape(numBins, numBins)
+    return counts
+
+def pairHistogramShape(pairs, ranges, numBins, rowFilter):
+    """ Returns the shape of the partial result of the histograms of the pairs """
+    return (len(pairs), numBins, numBins)
+
+def coMomentMatrixPartial(batches):
+    """ Returns the sums for the correlations of all the pairs of variables (see columnStats.CoMomentMatrix) """
+    moments = None
+    for batch in batches:
+        if moments is None:
+            moments = cS.CoMomentMatrix(batch.shape[1])
+        moments.update(batch)
+    return moments
+
+def coMomentMatrixMerge(results):
+    """ Merges the sums of the partitions; partitions without rows are ignored """
+    merged = None
+    for result in results:
+        if result is None:
+            continue
+        if merged is None:
+            merged = result
+        else:
+            merged.merge(result)
+    return merged
+
+def sumMerge(results):
+    """ Returns the sum of the partial results (numbers or arrays) """
+    total = results[0]
+    for result in results[1:]:
+        total = total + result
+    return total
+
+def frequenciesPartial(batches):
+    """ Returns a dictionary with the number of times each value of the first variable appears """
+    frequencies = {}
+    for batch in batches:
+        values = batch[:, 0]
+        values, counts = np.unique(values[~np.isnan(values)], return_counts=True)
+        for value, count in zip(values.tolist(), counts.tolist()):
+            frequencies[value] = frequencies.get(value, 0) + count
+    return frequencies
+
+def frequenciesMerge(results):
+    """ Adds the counts of each value """
+    frequencies = {}
+    for result in results:
+        for value in result:
+            frequencies[value] = frequencies.get(value, 0) + result[value]
+    return frequencies
+
+def fusedPartial(batches, specs):
+    """ Returns the list of partial results of several aggregates, given as a list of (partial,
+    merge, columns, args, shape, dtype), reading the rows only once: each block of rows is given
+    to every aggregate, and the result of the block is merged with those of the previous blocks. """
+    results = [None] * len(specs)
+    for batch in batches:
+        for i in range(len(specs)):
+            partial, merge, columns, args = specs[i][:4]
+            result = partial([batch[:, columns]], *args)
+            results[i] = result if results[i] is None else merge([results[i], result])
+    for i in range(len(specs)):
+        if results[i] is None:
+            # A partition without rows
+            partial, merge, columns, args = specs[i][:4]
+            results[i] = partial([], *args)
+    return results
+
+def fusedShape(specs):
+    """ Returns the list of (shape, dtype) of the partial results of the fused aggregates, or None
+    if any of them has no fixed size """
+    layout = []
+    for partial, merge, columns, args, shape, dtype in specs:
+        partShape = shape(*args) if shape is not None else None
+        if partShape is None or isinstance(partShape, list):
+            return None
+        layout.append((tuple(partShape), dtype))
+    return layout or None
+
+def fusedMerge(results):
+    """ Returns, for each of the fused aggregates, the list of its partial results (they are
+    merged by computeMany) """
+    return [[result[i] for result in results] for i in range(len(results[0]))]
+
+register('statistics', statisticsPartial, cS.mergeStatistics)
+register('histogram', histogramPartial, sumMerge, histogramShape, np.int64)
+register('pairhistogram', pairHistogramPartial, sumMerge, pairHistogramShape, np.int64)
+register('frequencies', frequenciesPartial, frequenciesMerge)
+register('comatrix', coMomentMatrixPartial, coMomentMatrixMerge)
+register('fused', fusedPartial, fusedMerge, fusedShape)
@@ -0,0 +1,139 @@
+"""
+Jobs run on background threads, so the window stays responsive while the data is scanned.
+A job is a function whose result is delivered to another function on the thread of the GUI
+(with wx.CallAfter), where the plot is updated. The threads mostly wait for the worker
+processes or the database, so a few of them are enough.
+The jobs of an interactive control are scheduled by key (e.g. the plot): only the last
+one of each key matters, a new job cancels the previous one, and a job can wait a short
+time before starting, so a burst of changes (typing, dragging a slider) costs a single
+computation.
+"""
+import threading
+import concurrent.futures as cf
+
+import wx
+
+# Flag of cancellation of the computations
+import workerPool as wP
+
+# The threads, None until they are needed
+executor = None
+executorLock = threading.Lock()
+
+# Number of jobs run at the same time
+maxJobs = 4
+
+# Last job scheduled for each key
+scheduled = {}
+
+class Job(object):
+    """
+    A job scheduled for a key.
+        -cancelled: Flag set when the job is superseded; a scan running for it stops.
+        -timer: The wx.CallLater waiting to start the job, if it was delayed.
+        -future: The concurrent.futures.Future of the job, once started.
+    """
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.timer = None
+        self.future = None
+
+    def cancel(self):
+        """ Cancels the job: not started if it is waiting, stopped if it is running """
+        self.cancelled.set()
+        if self.timer is not None:
+            self.timer.Stop()
+        if self.future is not None:
+            self.future.cancel()
+
+def getExecutor():
+    """ Returns the pool of threads, starting it if needed """
+    global executor
+    with executorLock:
+        if executor is None:
+            executor = cf.ThreadPoolExecutor(max_workers=maxJobs, thread_name_prefix='job')
+        return executor
+
+def submit(function, args=(), onResult=None, onError=None):
+    """ Runs function(*args) on a background thread. When it finishes, onResult(result) is
+    called on the thread of the GUI; if it fails, onError(exception) is called instead (or the
+    exception is raised there, if there is no onError). Returns the concurrent.futures.Future
+    of the job. """
+    future = getExecutor().submit(function, *args)
+    future.add_done_callback(lambda future: deliver(future, onResult, onError))
+    return future
+
+def schedule(key, function, args=(), onResult=None, onError=None, delay=0):
+    """ Like submit, for the jobs of 'key' (called from the thread of the GUI): the previous job
+    of the key is cancelled, and its result, if any, is discarded. With 'delay' (milliseconds)
+    the job starts only if no other job is scheduled for the key meanwhile. Returns the Job. """
+    job = Job()
+    previous = scheduled.get(key)
+    scheduled[key] = job
+    if previous is not None:
+        previous.cancel()
+
+    def isCurrent():
+        """ Returns True if the job was not superseded """
+        return scheduled.get(key) is job and not job.cancelled.is_set()
+
+    def finish(result):
+        if isCurrent():
+            del scheduled[key]
+            if onResult is not None:
+                onResult(result)
+
+    def fail(exception):
+        if isCurrent():
+            del scheduled[key]
+            if not isinstance(exception, wP.Cancelled):
+                (onError if onError is not None else raiseError)(exception)
+
+    def start():
+        if job.cancelled.is_set():
+            return
+        job.timer = None
+        job.future = submit(runJob, (job, function, args), finish, fail)
+
+    if delay > 0:
+        job.timer = wx.CallLater(delay, start)
+    else:
+        start()
+    return job
+
+def runJob(job, function, args):
+    """ Runs function(*args) on this thread, stopping it if the job is cancelled """
+    wP.setCancelFlag(job.cancelled)
+    try:
+        wP.checkCancelled()
+        return function(*args)
+    finally:
+        wP.setCancelFlag(None)
+
+def cancel(key):
+    """ Cancels the job of 'key', if any (e.g. when the plot is closed) """
+    job = scheduled.pop(key, None)
+    if job is not None:
+        job.cancel()
+
+def deliver(future, onResult, onError):
+    """ Sends the result of a finished job to the thread of the GUI """
+    if future.cancelled():
+        return
+    exception = future.exception()
+    if exception is not None:
+        wx.CallAfter(onError if onError is not None else raiseError, exception)
+    elif onResult is not None:
+        wx.CallAfter(onResult, future.result())
+
+def raiseError(exception):
+    """ Raises, on the thread of the GUI, the exception of a job """
+    raise exception
+
+def shutdown():
+    """ Stops the threads, the jobs not started yet are cancelled """
+    global executor
+    with executorLock:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+            executor = None
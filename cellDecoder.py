@@ -0,0 +1,124 @@
+"""
+Conversion of the cells of the data sources to floats. The converter of each variable is
+chosen once, from the type on the database (DESCRIBE) or the category on the description
+file of the .csv, and the cells are converted a whole column at a time. A cell that is not
+a valid value is not an error: it is reported as False on the validity mask of the column.
+"""
+import re
+from decimal import Decimal
+
+import numpy as np
+
+# Converters
+FLOAT = 'float'
+INTEGER = 'integer'
+
+# Valid text for each converter (a subset of what float() accepts, so it never fails)
+patterns = {
+    FLOAT: re.compile(r'^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$'),
+    INTEGER: re.compile(r'^\s*[-+]?\d+(\.0*)?\s*$'),
+}
+
+# Integer types of mysql
+integerTypes = ['tinyint', 'smallint', 'mediumint', 'int', 'integer', 'bigint', 'bit', 'year', 'bool', 'boolean']
+
+def converterFromSQLType(dataType):
+    """ Returns the converter for a column of the type 'dataType', as given by DESCRIBE (e.g. int(11)) """
+    baseType = dataType.split('(')[0].replace('unsigned', '').strip().lower()
+    if baseType in integerTypes:
+        return INTEGER
+    # Floats, and the text types, whose cells are parsed
+    return FLOAT
+
+def converterFromCategory(category):
+    """ Returns the converter for a variable of the .csv, from its category (0 -> numeric,
+    1 -> categorical, whose values are integer codes) """
+    if category == 1:
+        return INTEGER
+    return FLOAT
+
+def decodeCell(value, converter):
+    """ Returns the value of a cell as a float, and True if it is valid """
+    if value is None:
+        return float('nan'), False
+    if isinstance(value, (int, float, Decimal)):
+        number = float(value)
+        valid = number == number and (converter != INTEGER or number == int(number))
+        return number, valid
+    if isinstance(value, bytes):
+        value = value.decode('ascii', 'replace')
+    if patterns[converter].match(value):
+        return float(value), True
+    return float('nan'), False
+
+def decodeColumn(values, converter):
+    """
+    Converts the cells of a column (numbers, None, text or bytes).
+        -values: Sequence of the cells.
+        -converter: FLOAT or INTEGER.
+    Returns the array of floats and the validity mask; the invalid cells are nan.
+    """
+    try:
+        # Numbers, None and numeric text are converted by numpy at once
+        column = np.array(values, dtype=np.float64)
+    except (ValueError, TypeError):
+        # There are invalid cells, check each one
+        column = np.empty(len(values), dtype=np.float64)
+        valid = np.empty(len(values), dtype=bool)
+        for i in range(len(values)):
+            column[i], valid[i] = decodeCell(values[i], converter)
+        return column, valid
+    valid = ~np.isnan(column)
+    if converter == INTEGER:
+        valid &= np.floor(column) == column
+        column[~valid] = np.nan
+    return column, valid
+
+def decodeRows(rows, converters):
+    """
+    Converts a block of rows, whose cells are in the order of 'converters'.
+    Returns the 2D array of rows x variables, and the validity mask of the cells.
+    """
+    width = len(converters)
+    batch = np.empty((len(rows), width), dtype=np.float64)
+    valid = np.empty((len(rows), width), dtype=bool)
+    if len(rows) == 0:
+        return batch, valid
+    columns = list(zip(*rows))
+    for j in range(width):
+        batch[:, j], valid[:, j] = decodeColumn(columns[j], converters[j])
+    return batch, valid
+
+def decodeLines(lines, width, converters):
+    """
+    Converts a block of lines of a .csv (bytes) with 'width' variables.
+    Returns the 2D array of rows x variables, the validity mask of the cells and the mask
+    of the complete lines (with 'width' cells); the cells of the other lines are invalid.
+    """
+    complete = np.fromiter((line.count(b',') for line in lines), dtype=np.int64, count=len(lines)) == width - 1
+    rows = np.flatnonzero(complete)
+    batch = np.full((len(lines), width), np.nan)
+    valid = np.zeros((len(lines), width), dtype=bool)
+    if len(rows) == 0:
+        return batch, valid, complete
+    text = b''.join([lines[i] for i in rows] if len(rows) < len(lines) else lines)
+    if not text.endswith(b'\n'):
+        text += b'\n'
+    cells = text.replace(b'\n', b',').split(b',')
+    cells.pop()
+    try:
+        # All the cells are converted by numpy at once
+        block = np.array(cells, dtype=np.float64).reshape(len(rows), width)
+    except ValueError:
+        # There are invalid cells, convert a column at a time
+        del cells
+        block, blockValid = decodeRows([lines[i].split(b',') for i in rows], converters)
+    else:
+        blockValid = ~np.isnan(block)
+        for j in range(width):
+            if converters[j] == INTEGER:
+                blockValid[:, j] &= np.floor(block[:, j]) == block[:, j]
+        block[~blockValid] = np.nan
+    batch[rows] = block
+    valid[rows] = blockValid
+    return batch, valid, complete
@@ -0,0 +1,109 @@
+"""
+A binary cache for the columns of a .csv file. The cache is a directory next to the file
+(foo.csv -> foo.vacache/) containing one .npy array per variable and the fingerprint of
+the .csv it was built from. The arrays are memory mapped when loaded, so reopening a data
+set does not require parsing the text again, and the pages are shared among all the
+processes reading it.
+"""
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+
+class ColumnCache(object):
+    """
+    Handles the cache of a single .csv file.
+        -filename: The path to the .csv file.
+        -descrFilename: The path to the description file of the .csv.
+        -path: The directory of the cache.
+    """
+    # Bytes read from the beginning and the end of the file for the fingerprint
+    sampleSize = 1 << 16
+    version = 2
+
+    def __init__(self, filename, descrFilename):
+        self.filename = filename
+        self.descrFilename = descrFilename
+        self.path = filename.split('.csv')[0] + '.vacache'
+        self.metaFilename = os.path.join(self.path, 'meta.json')
+        self.meta = None
+
+    def fingerprint(self):
+        """ Returns the fingerprint of the .csv and the description file: the size, the modification
+        time and a hash of the first and last bytes of the data. """
+        stat = os.stat(self.filename)
+        digest = hashlib.sha1()
+        with open(self.filename, 'rb') as f:
+            digest.update(f.read(self.sampleSize))
+            if stat.st_size > self.sampleSize:
+                f.seek(max(stat.st_size - self.sampleSize, self.sampleSize), 0)
+                digest.update(f.read(self.sampleSize))
+        fingerprint = {'version': self.version, 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                       'hash': digest.hexdigest()}
+        if os.path.exists(self.descrFilename):
+            descrStat = os.stat(self.descrFilename)
+            fingerprint['descrSize'] = descrStat.st_size
+            fingerprint['descrMtime'] = descrStat.st_mtime_ns
+        return fingerprint
+
+    def isValid(self):
+        """ Returns True if the cache exists and corresponds to the current .csv file """
+        try:
+            with open(self.metaFilename, 'r') as f:
+                self.meta = json.load(f)
+            return self.meta['fingerprint'] == self.fingerprint()
+        except (OSError, ValueError, KeyError):
+            self.meta = None
+            return False
+
+    def getMeta(self, key, default=None):
+        """ Returns a value stored along the columns """
+        if not self.meta:
+            return default
+        return self.meta['values'].get(key, default)
+
+    def load(self):
+        """ Returns the columns stored on the cache, memory mapped and read only """
+        assert self.meta, "Cache not validated"
+        columns = []
+        for i in range(self.meta['numColumns']):
+            columns.append(np.load(os.path.join(self.path, 'column%d.npy' % i), mmap_mode='r'))
+        return columns
+
+    def loadArray(self, name):
+        """ Returns the array stored with the name 'name', memory mapped and read only """
+        assert self.meta, "Cache not validated"
+        return np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+
+    def store(self, columns, values=None, arrays=None):
+        """
+        Writes the columns to the cache. The cache is written on a temporary directory
+        and then renamed, so a process reading it never sees an incomplete cache.
+            -columns: List of arrays, one for each variable.
+            -values: Dictionary of other values (json serializable) to store.
+            -arrays: Dictionary of other arrays to store, by name.
+        Returns False if the cache could not be written.
+        """
+        tmpPath = self.path + '.tmp%d' % os.getpid()
+        try:
+            fingerprint = self.fingerprint()
+            shutil.rmtree(tmpPath, ignore_errors=True)
+            os.makedirs(tmpPath)
+            for i in range(len(columns)):
+                np.save(os.path.join(tmpPath, 'column%d.npy' % i), np.ascontiguousarray(columns[i]))
+            if arrays:
+                for name in arrays:
+                    np.save(os.path.join(tmpPath, name + '.npy'), np.ascontiguousarray(arrays[name]))
+            meta = {'fingerprint': fingerprint, 'numColumns': len(columns), 'values': values or {}}
+            # The metadata is written last, it marks the cache as complete
+            with open(os.path.join(tmpPath, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+            shutil.rmtree(self.path, ignore_errors=True)
+            os.rename(tmpPath, self.path)
+        except OSError:
+            shutil.rmtree(tmpPath, ignore_errors=True)
+            return False
+        self.meta = meta
+        return True
@@ -0,0 +1,398 @@
+"""
+Statistics of the variables of a data set. Each variable has an accumulator holding the
+minimum, maximum, number of values, sum, sum of squares, number of missing values, an
+estimate of the number of distinct values and a quantile sketch. The accumulators can be
+filled block by block and merged, so each partition of the data can be processed on its own.
+The co-moments of a pair of variables, or of all the pairs at once, for their correlation,
+are accumulated the same way.
+"""
+import math as m
+import random as r
+
+import numpy as np
+
+class ColumnStatistics(object):
+    """
+    Statistics of a single variable:
+        -min, max: The range of the variable.
+        -count: Number of (non missing) values.
+        -sum, sumSq: Sum and sum of squares of the values.
+        -nullCount: Number of missing values.
+        -droppedCount: Number of rows of the data source dismissed (e.g. with the wrong number of values).
+        -hashes: The smallest hashes of the values, for estimating the distinct values (KMV sketch).
+        -quantiles: Sketch for the quantiles (median, quartiles, percentiles) of the values.
+        -distinctCount: Number of distinct values, when it is known exactly.
+        -knownQuantiles: Quantiles computed exactly elsewhere (e.g. by the database), by q.
+    """
+    # Number of hashes kept for the distinct values estimate
+    sketchSize = 1024
+
+    def __init__(self):
+        self.min = float('inf')
+        self.max = -float('inf')
+        self.count = 0
+        self.sum = 0.0
+        self.sumSq = 0.0
+        self.nullCount = 0
+        self.droppedCount = 0
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.quantiles = QuantileSketch()
+        self.distinctCount = None
+        self.knownQuantiles = {}
+
+    def update(self, values):
+        """ Adds the values of the array 'values' to the statistics """
+        values = np.asarray(values, dtype=np.float64)
+        missing = np.isnan(values)
+        nMissing = int(missing.sum())
+        if nMissing:
+            values = values[~missing]
+            self.nullCount += nMissing
+        if len(values) == 0:
+            return
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.sumSq += float(np.dot(values, values))
+        self.addHashes(hashValues(values))
+        self.quantiles.update(values)
+
+    def merge(self, other):
+        """ Adds the statistics of another partition of the same variable """
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.count += other.count
+        self.sum += other.sum
+        self.sumSq += other.sumSq
+        self.nullCount += other.nullCount
+        self.droppedCount += other.droppedCount
+        self.addHashes(other.hashes)
+        self.quantiles.merge(other.quantiles)
+
+    def addHashes(self, hashes):
+        """ Keeps the smallest distinct hashes. Only the hashes below the largest one kept can enter
+        the sketch, and only the smallest of them are sorted, not the whole block. """
+        if len(self.hashes) >= self.sketchSize:
+            hashes = hashes[hashes < self.hashes[-1]]
+        merged = None
+        if len(hashes) > self.sketchSize:
+            # The smallest hashes; with repeated values there could be fewer distinct ones than needed
+            limit = np.partition(hashes, self.sketchSize - 1)[self.sketchSize - 1]
+            merged = sortedUnique(np.concatenate([self.hashes, hashes[hashes <= limit]]))
+            if np.count_nonzero(merged <= limit) < self.sketchSize:
+                merged = None
+        if merged is None:
+            merged = sortedUnique(np.concatenate([self.hashes, hashes]))
+        self.hashes = merged[:self.sketchSize]
+
+    def mean(self):
+        """ Returns the mean of the values """
+        if self.count == 0:
+            return float('nan')
+        return self.sum / self.count
+
+    def variance(self):
+        """ Returns the (population) variance of the values """
+        if self.count == 0:
+            return float('nan')
+        mean = self.sum / self.count
+        return max(self.sumSq / self.count - mean * mean, 0.0)
+
+    def distinct(self):
+        """ Returns the estimate of the number of distinct values. It is exact when there are
+        fewer distinct values than the size of the sketch. """
+        if self.distinctCount is not None:
+            return self.distinctCount
+        k = len(self.hashes)
+        if k < self.sketchSize:
+            return k
+        # The k-th smallest hash, as a fraction of the hash space
+        kth = float(self.hashes[k - 1]) / 2.0 ** 64
+        return int((k - 1) / kth)
+
+    def getRange(self):
+        """ Returns the range of the variable as [min, max] """
+        return [self.min, self.max]
+
+    def quantile(self, q):
+        """ Returns the (approximate) q-quantile of the values, q in [0, 1] """
+        if q in self.knownQuantiles:
+            return self.knownQuantiles[q]
+        return self.quantiles.quantile(q)
+
+    def median(self):
+        """ Returns the (approximate) median of the values """
+        return self.quantile(0.5)
+
+    def IQR(self):
+        """ Returns the (approximate) interquartile range of the values """
+        return self.quantile(0.75) - self.quantile(0.25)
+
+class QuantileSketch(object):
+    """
+    Mergeable sketch for the quantiles of a stream of values, based on the KLL sketch.
+    The values are kept on levels of compactors; an item on level h represents 2^h values.
+    When a level is full it is sorted, and every other item (starting at a random offset)
+    is promoted to the next level, so the memory used is bounded regardless of the number
+    of values, while the rank error stays around 1.7% with the default k.
+        -k: Capacity of the top level, it controls the accuracy.
+        -levels: Array of items of each level.
+        -count: Number of values added.
+    """
+    def __init__(self, k=200):
+        self.k = k
+        self.levels = [np.empty(0, dtype=np.float64)]
+        self.count = 0
+
+    def capacity(self, level):
+        """ Returns the capacity of the level; lower levels have less capacity """
+        depth = len(self.levels) - level - 1
+        return max(int(m.ceil(self.k * (2.0 / 3.0) ** depth)), 2)
+
+    def update(self, values):
+        """ Adds the values of the array 'values' """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self.compress()
+
+    def merge(self, other):
+        """ Adds the values of another sketch """
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype=np.float64))
+        for h in range(len(other.levels)):
+            self.levels[h] = np.concatenate((self.levels[h], other.levels[h]))
+        self.count += other.count
+        self.compress()
+
+    def compress(self):
+        """ Compacts the levels until all of them are within capacity """
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) <= self.capacity(h):
+                h += 1
+                continue
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0, dtype=np.float64))
+            items = np.sort(items)
+            # With an odd number of items, one of them stays on this level
+            keep = items[:len(items) % 2]
+            items = items[len(items) % 2:]
+            promoted = items[r.getrandbits(1)::2]
+            self.levels[h] = keep
+            self.levels[h + 1] = np.concatenate((self.levels[h + 1], promoted))
+            # The capacities change when a level is added, start again
+            h = 0
+
+    def quantile(self, q):
+        """ Returns the approximate q-quantile, q in [0, 1] """
+        assert 0.0 <= q <= 1.0, "Quantile out of range"
+        if self.count == 0:
+            return float('nan')
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(self.levels[h]), 2.0 ** h) for h in range(len(self.levels))])
+        order = np.argsort(values, kind='stable')
+        values = values[order]
+        cumulative = np.cumsum(weights[order])
+        i = int(np.searchsorted(cumulative, q * cumulative[-1], side='left'))
+        return float(values[min(i, len(values) - 1)])
+
+class CoMoments(object):
+    """
+    Moments and co-moment of a pair of variables (x, y), for their covariance and correlation.
+    Each block is reduced to its own means and sums of squared deviations, which are combined
+    with those of the previous blocks (Chan et al.), so there is no cancellation between large
+    sums as with the sums of squares, and partitions can be merged in any order.
+        -count: Number of rows with both values.
+        -meanX, meanY: Means of the values.
+        -m2X, m2Y: Sums of the squared deviations from the mean.
+        -cXY: Sum of the products of the deviations of x and y.
+    """
+    def __init__(self):
+        self.count = 0
+        self.meanX = 0.0
+        self.meanY = 0.0
+        self.m2X = 0.0
+        self.m2Y = 0.0
+        self.cXY = 0.0
+
+    def update(self, x, y):
+        """ Adds the pairs of the arrays 'x' and 'y'; the pairs with a missing value are ignored """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        valid = ~(np.isnan(x) | np.isnan(y))
+        x = x[valid]
+        y = y[valid]
+        if len(x) == 0:
+            return
+        block = CoMoments()
+        block.count = len(x)
+        block.meanX = float(x.mean())
+        block.meanY = float(y.mean())
+        dx = x - block.meanX
+        dy = y - block.meanY
+        block.m2X = float(np.dot(dx, dx))
+        block.m2Y = float(np.dot(dy, dy))
+        block.cXY = float(np.dot(dx, dy))
+        self.merge(block)
+
+    def merge(self, other):
+        """ Adds the moments of another partition of the same pair of variables """
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.meanX, self.meanY = other.count, other.meanX, other.meanY
+            self.m2X, self.m2Y, self.cXY = other.m2X, other.m2Y, other.cXY
+            return
+        count = self.count + other.count
+        deltaX = other.meanX - self.meanX
+        deltaY = other.meanY - self.meanY
+        weight = self.count * other.count / count
+        self.meanX += deltaX * other.count / count
+        self.meanY += deltaY * other.count / count
+        self.m2X += other.m2X + deltaX * deltaX * weight
+        self.m2Y += other.m2Y + deltaY * deltaY * weight
+        self.cXY += other.cXY + deltaX * deltaY * weight
+        self.count = count
+
+    def covariance(self):
+        """ Returns the (population) covariance of x and y """
+        if self.count == 0:
+            return float('nan')
+        return self.cXY / self.count
+
+    def correlation(self):
+        """ Returns the Pearson correlation coefficient of x and y, nan if either is constant """
+        denominator = m.sqrt(self.m2X * self.m2Y)
+        if denominator == 0:
+            return float('nan')
+        return max(-1.0, min(1.0, self.cXY / denominator))
+
+class CoMomentMatrix(object):
+    """
+    Sums for the covariance and correlation of all the pairs of several variables, filled with
+    a few matrix products per block of rows. Each pair uses the rows where both values are
+    present. The values are shifted by a reference close to the mean (the means of the first
+    block), which keeps the sums of squares away from cancellation; partitions with different
+    references are brought to the same one when merged.
+        -shift: Reference of each variable, subtracted from its values.
+        -n: Number of rows with both values of each pair.
+        -sx: sx[i, j], sum of the shifted values of i on the rows where j is present too.
+        -sxx: sxx[i, j], sum of the squares of the shifted values of i, likewise.
+        -sxy: sxy[i, j], sum of the products of the shifted values of i and j.
+    """
+    def __init__(self, length):
+        self.shift = None
+        self.n = np.zeros((length, length))
+        self.sx = np.zeros((length, length))
+        self.sxx = np.zeros((length, length))
+        self.sxy = np.zeros((length, length))
+
+    def update(self, batch):
+        """ Adds the rows of the 2D array 'batch' (rows x variables); missing values are nan """
+        batch = np.asarray(batch, dtype=np.float64)
+        if len(batch) == 0:
+            return
+        valid = ~np.isnan(batch)
+        if self.shift is None:
+            with np.errstate(invalid='ignore'):
+                counts = valid.sum(axis=0)
+                self.shift = np.where(counts > 0, np.where(valid, batch, 0.0).sum(axis=0) / np.maximum(counts, 1), 0.0)
+        shifted = np.where(valid, batch - self.shift, 0.0)
+        present = valid.astype(np.float64)
+        self.n += present.T @ present
+        self.sx += shifted.T @ present
+        self.sxx += (shifted * shifted).T @ present
+        self.sxy += shifted.T @ shifted
+
+    def merge(self, other):
+        """ Adds the sums of another partition of the same variables """
+        if other.shift is None:
+            return
+        if self.shift is None:
+            self.shift, self.n, self.sx, self.sxx, self.sxy = other.shift, other.n, other.sx, other.sxx, other.sxy
+            return
+        # Bring the sums of the other partition to the shift of this one
+        delta = (other.shift - self.shift)[:, None]
+        sx = other.sx + delta * other.n
+        sxx = other.sxx + 2 * delta * other.sx + delta * delta * other.n
+        sxy = other.sxy + delta.T * other.sx + delta * other.sx.T + delta * delta.T * other.n
+        self.n = self.n + other.n
+        self.sx = self.sx + sx
+        self.sxx = self.sxx + sxx
+        self.sxy = self.sxy + sxy
+
+    def covariance(self):
+        """ Returns the matrix of the (population) covariances; nan for pairs without rows """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (self.sxy - self.sx * self.sx.T / self.n) / self.n
+
+    def correlation(self):
+        """ Returns the matrix of the Pearson correlation coefficients; nan for the pairs
+        without rows or where a variable is constant """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            products = self.sxy - self.sx * self.sx.T / self.n
+            squares = self.sxx - self.sx * self.sx / self.n
+            denominator = np.sqrt(np.maximum(squares, 0.0) * np.maximum(squares.T, 0.0))
+            r = products / denominator
+        r[denominator == 0] = np.nan
+        return np.clip(r, -1.0, 1.0)
+
+def fromAggregates(count, nullCount, minimum, maximum, mean, std, distinct):
+    """ Returns the statistics of a variable from its aggregates, as computed by a database.
+    The sums are recovered from the mean and the (population) standard deviation. """
+    stats = ColumnStatistics()
+    stats.count = int(count)
+    stats.nullCount = int(nullCount)
+    stats.distinctCount = int(distinct)
+    if stats.count > 0:
+        stats.min = float(minimum)
+        stats.max = float(maximum)
+        stats.sum = float(mean) * stats.count
+        stats.sumSq = (float(std) ** 2 + float(mean) ** 2) * stats.count
+    return stats
+
+def sortedUnique(values):
+    """ Returns the distinct values of the array, sorted (as numpy.unique, with a plain sort) """
+    values = np.sort(values)
+    if len(values) == 0:
+        return values
+    keep = np.empty(len(values), dtype=bool)
+    keep[0] = True
+    np.not_equal(values[1:], values[:-1], out=keep[1:])
+    return values[keep]
+
+def hashValues(values):
+    """ Returns a 64 bit hash for each value of the array (splitmix64 finalizer over the bits of the float) """
+    # Avoid different hashes for 0.0 and -0.0
+    x = (np.asarray(values, dtype=np.float64) + 0.0).view(np.uint64)
+    with np.errstate(over='ignore'):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        x = x ^ (x >> np.uint64(31))
+    return x
+
+def computeStatistics(batches, length):
+    """ Returns the list of statistics of the 'length' variables from an iterable of 2D blocks of rows """
+    statistics = [ColumnStatistics() for i in range(length)]
+    for batch in batches:
+        for i in range(length):
+            statistics[i].update(batch[:, i])
+    return statistics
+
+def mergeStatistics(partitions):
+    """ Merges the lists of statistics of several partitions of the data """
+    merged = None
+    for statistics in partitions:
+        if merged is None:
+            merged = statistics
+            continue
+        for i in range(len(merged)):
+            merged[i].merge(statistics[i])
+    return merged
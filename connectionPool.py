@@ -0,0 +1,150 @@
+"""
+A bounded pool of connections to a mysql server. The database source and its copies take
+a connection from the pool for each scan or query and give it back when they are done, so
+the connections (and the time for opening them) are reused among recomputations. A process
+created with fork does not use the connections of its parent: the pool starts empty on it.
+"""
+import os
+import threading
+import time as t
+
+import pymysql
+
+# Pools of this process, by parameters, for the pools received from another process
+pools = {}
+
+def sharedPool(params, maxSize):
+    """ Returns the pool of this process for the parameters, creating it if needed, so the
+    tasks run by a worker process reuse the connections. """
+    key = tuple(sorted(params.items(), key=lambda item: item[0]))
+    if key not in pools:
+        pools[key] = ConnectionPool(params, maxSize)
+    return pools[key]
+
+class ConnectionPool(object):
+    """
+    Pool of connections with the same parameters.
+        -params: Arguments for pymysql.connect.
+        -maxSize: Maximum number of connections open at the same time (on each process).
+        -idle: List of (connection, time it was returned) ready to be used.
+        -inUse: Number of connections taken from the pool.
+    """
+    # Seconds a connection can be idle before checking if it is still alive
+    pingInterval = 60
+
+    def __init__(self, params, maxSize=4):
+        assert maxSize > 0, "The pool must have at least one connection"
+        self.params = params
+        self.maxSize = maxSize
+        self.reset()
+
+    def reset(self):
+        """ Empties the pool, and sets the metrics to zero """
+        self.pid = os.getpid()
+        self.condition = threading.Condition()
+        self.idle = []
+        self.inUse = 0
+        # Metrics
+        self.created = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.waitTime = 0.0
+        self.maxWaitTime = 0.0
+
+    def __reduce__(self):
+        """ A pool sent to another process becomes the pool of that process with the same parameters """
+        return (sharedPool, (self.params, self.maxSize))
+
+    def checkForFork(self):
+        """ Forgets the connections of the parent process, when running on a forked process """
+        if self.pid != os.getpid():
+            self.reset()
+
+    def checkout(self, timeout=None):
+        """ Returns a connection, reusing an idle one if possible. If all the connections are in
+        use, waits until one is returned, for at most 'timeout' seconds (forever if None). """
+        self.checkForFork()
+        with self.condition:
+            start = t.time()
+            waited = False
+            while not self.idle and self.inUse >= self.maxSize:
+                waited = True
+                remaining = None if timeout is None else timeout - (t.time() - start)
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("No database connection available")
+                self.condition.wait(remaining)
+            if waited:
+                elapsed = t.time() - start
+                self.waits += 1
+                self.waitTime += elapsed
+                self.maxWaitTime = max(self.maxWaitTime, elapsed)
+            self.checkouts += 1
+            self.inUse += 1
+            connection, since = self.idle.pop() if self.idle else (None, 0)
+        try:
+            if connection is not None and t.time() - since > self.pingInterval:
+                # The server may have closed it
+                connection.ping(reconnect=True)
+            if connection is None or not connection.open:
+                connection = self.connect()
+        except:
+            self.discard(None)
+            raise
+        return connection
+
+    def connect(self):
+        """ Opens a new connection """
+        connection = pymysql.connect(**self.params)
+        with self.condition:
+            self.created += 1
+        return connection
+
+    def checkin(self, connection):
+        """ Returns a connection to the pool. The connection must not have a result pending. """
+        self.checkForFork()
+        with self.condition:
+            self.inUse = max(self.inUse - 1, 0)
+            if connection.open:
+                self.idle.append((connection, t.time()))
+            self.condition.notify()
+
+    def discard(self, connection):
+        """ Closes a connection taken from the pool, e.g. if a result was left incomplete on it,
+        which would have to be read before the connection can be used again. """
+        self.checkForFork()
+        if connection is not None:
+            try:
+                connection.close()
+            except:
+                pass
+        with self.condition:
+            self.inUse = max(self.inUse - 1, 0)
+            self.condition.notify()
+
+    def close(self):
+        """ Closes the idle connections """
+        self.checkForFork()
+        with self.condition:
+            idle = self.idle
+            self.idle = []
+        for connection, since in idle:
+            try:
+                connection.close()
+            except:
+                pass
+
+    def getMetrics(self):
+        """ Returns a dictionary with the metrics of the pool:
+            -size: Connections open.
+            -idle, inUse: Connections on the pool and taken from it.
+            -maxSize: Maximum number of connections.
+            -created: Connections opened since the pool was created.
+            -checkouts: Number of times a connection was taken.
+            -waits: Number of times a connection had to be waited for.
+            -waitTime, maxWaitTime: Total and longest time waited, in seconds.
+        """
+        self.checkForFork()
+        with self.condition:
+            return {'size': len(self.idle) + self.inUse, 'idle': len(self.idle), 'inUse': self.inUse,
+                    'maxSize': self.maxSize, 'created': self.created, 'checkouts': self.checkouts,
+                    'waits': self.waits, 'waitTime': self.waitTime, 'maxWaitTime': self.maxWaitTime}
@@ -2,32 +2,104 @@
 A module that implements an iterator for retrieving data from either a database or
 a .cvs file (posible a stream). The iterator abstracts the need for a generator 
 for each kind of data source, and handles all differences.
+The data loaded is not modified afterwards: its cursors (see Data.cursor) share it, each one
+with its own position, so several plots can read it at the same time from different threads.
 """
 import wx
 import pymysql.cursors
 import threading
 import queue
 import time as t
+# For the columnar data
+import numpy as np
 # For the streaming
 import dataStreaming as dS
+# Binary cache of the csv columns
+import columnCache as cC
+# Statistics of each variable
+import columnStats as cS
+# Connections to the database
+import connectionPool as cP
+# Conversion of the cells
+import cellDecoder as cD
+# Parallel computation of aggregates
+import aggregation as ag
+# Columns shared with the workers
+import sharedArrays as sA
+# Cancellation of the computations
+import workerPool as wP
 
 class Data(object):
     """
     Class for retrieving the data. Handles the differences between a database and an csv file.
     """
-    def __init__(self, flag):
+    # Default number of rows on each batch
+    batchSize = 1 << 16
+    # Bytes of text parsed at once from a csv
+    chunkSize = 1 << 24
+    # Maximum number of connections to the database, and seconds to wait for one
+    poolSize = 8
+    poolTimeout = 30
+    # Values that mark a missing value, by default
+    defaultMissingValues = ['', 'NA', 'NaN', '?']
+
+    def __init__(self, flag, missingValues=None):
         """ Constructor of the class.
             -flag: Indicates if a database or an csv is to be loaded (0 -> database, 1 -> csv, 2 -> stream).
+            -missingValues: List of the values that mark a missing value (e.g. -9, 'NA' or '').
+                            Any other value that is not a number is missing as well.
         """
         self.sourceFlag = flag
+        self.missingValues = []
+        self.missingNumbers = None
+        self.setMissingValues(self.defaultMissingValues if missingValues is None else missingValues)
         self.dbCursor = None
         self.dbConnection = None
+        # Connections to the database, shared by the copies
+        self.pool = None
+        self.ownsPool = False
+        # If the rows of a query are being read from the connection
+        self.scanning = False
+        # Variable (number) of the primary key of the table, if it has one
+        self.primaryKey = None
+        # Rows [startRow, endRow) of the table read by the scan (endRow None for all of them)
+        self.startRow = 0
+        self.endRow = None
         self.File = None
         self.descrFile = None
         self.data = None
         self.name = None
         self.totalRows = 0
-        self.lenRow = 0
+        # Byte offset of each row of the csv
+        self.offsets = None
+        # Number of the next row of the csv
+        self.position = 0
+        # Variables returned on each row (None for all of them)
+        self.projection = None
+        self.maxProjected = -1
+        self.labels = None
+        self.category = None
+        # Converter of the cells of each variable (cellDecoder), chosen from the description
+        self.converters = None
+        self.converterCache = None
+        # Results computed once and shared by the cursors (the statistics of each variable,
+        # the correlation coefficients of all the pairs of variables), by name. Each result has
+        # its own lock (see resultLock), so reading a result never waits for the scan of another
+        self.results = {}
+        self.resultLocks = {}
+        self.resultsLock = threading.Lock()
+        # Categorical variables of the csv, as (codes, table of values) by axis
+        self.dictionaries = {}
+        # The variables of the csv, one array per variable (nan on the missing values)
+        self.columns = None
+        # Bitmap of the valid (not missing) values of each variable of the csv
+        self.validity = None
+        # Number of rows of the csv dismissed, with the wrong number of values
+        self.droppedRows = 0
+        # Columns on shared memory for the workers (shared by the copies), created when needed
+        self.shared = {}
+        self.sharedLock = threading.Lock()
+        self.ownsShared = False
         # For the streaming
         self.stream = None
         self.exitQ = None
@@ -51,48 +123,223 @@ class Data(object):
         # If a database is not selected, return
         if self.sourceFlag != 0:
             return
+        params = {'host': host, 'user': user, 'password': passwd, 'db': dbName,
+                  'charset': 'utf8mb4', 'cursorclass': pymysql.cursors.SSCursor}
+        self.pool = cP.ConnectionPool(params, self.poolSize)
+        self.ownsPool = True
         # Connect
         try:
-            self.dbConnection = pymysql.connect(host=host, user=user, password=passwd, db=dbName, 
-                                            charset='utf8mb4', cursorclass=pymysql.cursors.SSCursor)
-            # Get the cursor
-            self.dbCursor = self.dbConnection.cursor()
+            self.connect()
         except:
             return False
 
         return True
 
-    def loadCSV(self, filename):
+    def connect(self):
+        """ Takes a connection to the database from the pool """
+        self.dbConnection = self.pool.checkout(self.poolTimeout)
+        # Get the cursor
+        self.dbCursor = self.dbConnection.cursor()
+
+    def release(self):
+        """ Returns the connection to the pool. If the rows of a query were not read completely,
+        the connection is closed instead: reading the remaining rows could take long. """
+        if self.dbConnection is None:
+            return
+        if self.scanning:
+            self.pool.discard(self.dbConnection)
+        else:
+            self.dbCursor.close()
+            self.pool.checkin(self.dbConnection)
+        self.dbConnection = None
+        self.dbCursor = None
+        self.scanning = False
+
+    def setMissingValues(self, values):
+        """ Sets the values that mark a missing value. It must be called before loading the data. """
+        self.missingValues = list(values)
+        numbers = []
+        for value in self.missingValues:
+            number, valid = cD.decodeCell(value, cD.FLOAT)
+            if valid:
+                numbers.append(number)
+        self.missingNumbers = np.array(numbers, dtype=np.float64)
+
+    def maskMissing(self, batch, valid):
+        """ Marks the values equal to a missing value mark as not valid, and sets all the
+        values that are not valid to nan. Returns the batch. """
+        if len(self.missingNumbers):
+            valid &= ~np.isin(batch, self.missingNumbers)
+        batch[~valid] = np.nan
+        return batch
+
+    def getPoolMetrics(self):
+        """ Returns the metrics of the pool of connections (see ConnectionPool.getMetrics) """
+        if self.pool is None:
+            return None
+        return self.pool.getMetrics()
+
+    def loadCSV(self, filename, useCache=True):
         """
-        Loads a cvs file.
+        Loads a cvs file. The file is parsed only once, and each variable is stored on its own
+        array, so the plots can compute over them without reading the file again. The arrays
+        are saved on a binary cache next to the file, which is memory mapped on later loads.
             -filename: The path to the file.
+            -useCache: If the binary cache is to be used.
         """
         if self.sourceFlag != 1:
             return
         self.name = filename
+        self.ownsShared = True
+        descrfilename = self.name.split('.csv')[0] + '_descr.csv'
         # Open
         self.File = open(self.name, 'r')
-        # Get the numer of data
-        i = 0
-        self.lenRow = 0
-        for line in self.File:
-            i += 1
-            self.lenRow += len(line)
-            del line
-        self.totalRows = i
-        # Get the avarage length of the lines
-        self.lenRow /= i
-        # Return to beginning of file
-        self.File.seek(0, 0)
+        self.converters = self.readConverters(descrfilename)
+        cache = cC.ColumnCache(self.name, descrfilename)
+        missingValues = [str(value) for value in self.missingValues]
+        if useCache and cache.isValid() and cache.getMeta('missingValues') == missingValues:
+            self.loadCache(cache)
+        else:
+            # Get the data, the number of rows and the position of each row
+            self.parseColumns()
+            if useCache:
+                arrays = {'offsets': self.offsets}
+                for i in range(len(self.validity)):
+                    arrays['valid%d' % i] = self.validity[i]
+                values = {'totalRows': self.totalRows, 'droppedRows': self.droppedRows,
+                          'missingValues': missingValues}
+                if cache.store(self.columns, values, arrays):
+                    # The arrays parsed are replaced by the files, whose pages are shared with
+                    # the workers instead of being copied for them
+                    self.loadCache(cache)
         # Get the description file
-        descrfilename = self.name.split('.csv')[0] + '_descr.csv'
         try:
             self.descrFile = open(descrfilename, 'r')
         except:
             return False
         else:
+            self.encodeCategories()
             return True
 
+    def loadCache(self, cache):
+        """ Maps the columns, their validity and the rows index from the cache """
+        self.columns = cache.load()
+        self.offsets = cache.loadArray('offsets')
+        self.validity = [cache.loadArray('valid%d' % i) for i in range(len(self.columns))]
+        self.totalRows = cache.getMeta('totalRows', 0)
+        self.droppedRows = cache.getMeta('droppedRows', 0)
+
+    def readConverters(self, descrfilename):
+        """ Returns the converter of each variable of the csv, from the categories on the description
+        file (second line), or None if the file can not be read. """
+        try:
+            with open(descrfilename, 'r') as f:
+                f.readline()
+                line = f.readline()
+            return [cD.converterFromCategory(int(c)) for c in line.split(',')]
+        except (OSError, ValueError):
+            return None
+
+    def getConverters(self, axes):
+        """ Returns the converters of the variables on the list 'axes' """
+        if not self.converters:
+            return [cD.FLOAT] * len(axes)
+        return [self.converters[i] if i < len(self.converters) else cD.FLOAT for i in axes]
+
+    def rowConverters(self, width):
+        """ Returns the converters of the cells of a row of the data source with 'width' cells """
+        if self.converterCache is None or self.converterCache[0] != width:
+            axes = range(width) if self.projection is None else self.projection
+            self.converterCache = (width, self.getConverters(axes))
+        return self.converterCache[1]
+
+    def encodeCategories(self):
+        """
+        Stores each categorical variable of the csv (category 1 on the description file) as
+        an array of small integer codes, plus the table of values each code represents. The
+        table contains the values listed on the description file and any other value found
+        on the data.
+        """
+        self.dictionaries = {}
+        lines = self.descrFile.readlines()
+        self.descrFile.seek(0, 0)
+        if len(lines) < 2:
+            return
+        category = [int(c) for c in lines[1].split(',')]
+        for axis in range(min(len(category), len(self.columns))):
+            if category[axis] != 1:
+                continue
+            # The values listed on the description, in the format value=name
+            values = []
+            for line in lines[2:]:
+                fields = line.split(',')
+                if axis >= len(fields) or '=' not in fields[axis]:
+                    continue
+                try:
+                    values.append(float(fields[axis].split('=')[0]))
+                except ValueError:
+                    continue
+            column = self.columns[axis]
+            valid = self.getValid(axis)
+            table = np.union1d(np.array(values, dtype=np.float64), np.unique(column[valid]))
+            if len(table) <= 1 << 8:
+                dtype = np.uint8
+            elif len(table) <= 1 << 16:
+                dtype = np.uint16
+            else:
+                dtype = np.uint32
+            codes = np.searchsorted(table, column).astype(dtype)
+            # The missing values have code 0, they are told apart by the validity
+            codes[~valid] = 0
+            self.dictionaries[axis] = (codes, table)
+
+    def parseColumns(self):
+        """
+        Reads the whole csv file, storing each variable as an array of floats, and the
+        byte offset where each row starts, so any row can be reached with a single seek.
+        The text is parsed by blocks of lines, a column at a time. The values that are not
+        valid are missing: they are stored as nan, and marked on the bitmap of validity of
+        the variable. Only the rows with a wrong number of values are dismissed.
+        """
+        blocks = []
+        masks = []
+        offsets = []
+        position = 0
+        self.droppedRows = 0
+        width = len(self.converters) if self.converters else None
+        with open(self.name, 'rb') as f:
+            while True:
+                lines = f.readlines(self.chunkSize)
+                if not lines:
+                    break
+                if width is None:
+                    # No description, the first row gives the number of variables
+                    width = len(lines[0].split(b','))
+                batch, valid, keep = cD.decodeLines(lines, width, self.getConverters(range(width)))
+                self.maskMissing(batch, valid)
+                # Incomplete rows, dismiss them
+                self.droppedRows += len(lines) - int(keep.sum())
+                lengths = np.fromiter((len(line) for line in lines), dtype=np.int64, count=len(lines))
+                starts = position + np.cumsum(lengths) - lengths
+                position += int(lengths.sum())
+                blocks.append(batch[keep])
+                masks.append(valid[keep])
+                offsets.append(starts[keep])
+                del lines
+        width = width or 0
+        self.offsets = np.concatenate(offsets) if offsets else np.empty(0, dtype=np.int64)
+        del offsets
+        # One contiguous array per variable
+        table = np.concatenate(blocks) if blocks else np.empty((0, width), dtype=np.float64)
+        del blocks
+        self.totalRows = len(table)
+        self.columns = [table[:, j].copy() for j in range(width)]
+        del table
+        valid = np.concatenate(masks) if masks else np.empty((0, width), dtype=bool)
+        del masks
+        self.validity = [np.packbits(valid[:, j]) for j in range(width)]
+        del valid
+
     def connectToStream(self, address, ctype):
         """ 
         Connects to a stream.
@@ -143,8 +390,10 @@ class Data(object):
 
         # If the source is a database
         if self.sourceFlag == 0:
-            if not self.dbCursor:
+            if not self.pool:
                 return
+            if self.dbConnection is None:
+                self.connect()
 
             sqlcmd = "SHOW TABLES"
             self.dbCursor.execute(sqlcmd)
@@ -157,11 +406,20 @@ class Data(object):
             descr = self.dbCursor.fetchall_unbuffered()
 
             # Get the description of each variable
+            keys = []
+            converters = []
             for variable in descr:
                 # Name
                 labels.append(variable[0])
                 # Type
                 category.append(isNumeric(variable[1]))
+                converters.append(cD.converterFromSQLType(variable[1]))
+                # Key
+                if variable[3] == 'PRI':
+                    keys.append(len(labels) - 1)
+            # Only a single column key is used for the partitions
+            self.primaryKey = keys[0] if len(keys) == 1 else None
+            self.converters = converters
 
             # Get the description of the variables, from the descr table
             sqlcmd = "SELECT * FROM descr"
@@ -185,6 +443,10 @@ class Data(object):
                 for r in line:
                     row.append(r)
                 description.append(row.copy())
+            # All the results were read, the connection can be used by others
+            self.release()
+            # Get the number of rows, for the partitions
+            self.totalRows = int(self.query("SELECT COUNT(*) FROM " + self.name)[0][0])
 
         # If the source is a csv.
         elif self.sourceFlag == 1:
@@ -221,6 +483,8 @@ class Data(object):
                 category.append(0)
         
         self.length = len(labels)
+        self.labels = labels
+        self.category = category
         assert len(labels) == len(category), "Incorrect number of labels and category"
         assert len(category) == self.length, "Incorrect number of categories"
         return labels, category, description, units
@@ -229,6 +493,10 @@ class Data(object):
         """ Returns the number of axes in the database """
         return self.length
 
+    def numberVariables(self):
+        """ Returns the number of variables of each row: those of the projection, if any """
+        return self.length if self.projection is None else len(self.projection)
+
     def __iter__(self):
         return self
 
@@ -242,55 +510,37 @@ class Data(object):
         if self.sourceFlag == 0:
             # For a db
             if not self.data:
-                sqlcmd = "SELECT * FROM " + self.name
-                self.dbCursor.execute(sqlcmd)
-                self.data = self.dbCursor.fetchall_unbuffered()
+                self.startScan()
+            elif not self.scanning:
+                raise StopIteration()
             try:
-                while True:
-                    del data
-                    data = []
-                    noisy = False
-                    ndata = next(self.data)
-                    for d in ndata:
-                        try:
-                            float(d)
-                        except:
-                            # Incomplete data, dismiss row
-                            data.clear()
-                            noisy = True
-                            break
-                        else:
-                            data.append(float(d))
-                    if not noisy:
-                        break
+                ndata = next(self.data)
+                data = self.decodeRow(ndata)
 
             except StopIteration as e:
+                self.endScan()
                 raise e
 
         elif self.sourceFlag == 1:
             del data
-            data = []
-            noisy = False
             while True:
-                noisy = False
                 line = self.File.readline()
                 if line == "":
                     raise StopIteration()
             
                 row = line.split(',')
-                for r in row:
-                    try:
-                        float(r)
-                    except ValueError:
-                        # Incomplete data, dismiss row
-                        data.clear()
-                        noisy = True
-                        break
-                    else:
-                        data.append(float(r))
-                # Read next row
-                if not noisy:
-                    break
+                if self.columns is not None and len(row) != len(self.columns):
+                    # Incomplete row, dismiss it (as when loading the columns)
+                    continue
+                if self.projection is not None:
+                    # Parse only the selected variables
+                    if len(row) <= self.maxProjected:
+                        # Incomplete row, dismiss it
+                        continue
+                    row = [row[i] for i in self.projection]
+                data = self.decodeRow(row)
+                break
+            self.position += 1
         
         elif self.sourceFlag == 2:
             del data
@@ -325,61 +575,589 @@ class Data(object):
                 # self.workQLock.release()
             if data == []:
                 raise StopIteration()
+            if self.projection is not None:
+                data = [data[i] for i in self.projection]
+
+        return data
 
+    def decodeRow(self, row):
+        """ Returns the list of values of a row of the data source (the projected variables),
+        nan for the missing values """
+        converters = self.rowConverters(len(row))
+        data = []
+        for i in range(len(row)):
+            value, valid = cD.decodeCell(row[i], converters[i])
+            if not valid or value in self.missingNumbers:
+                value = float('nan')
+            data.append(value)
         return data
 
+    def project(self, axes):
+        """ Returns a copy of the iterator whose rows and batches contain only the variables
+        on the list 'axes', in that order. Only those variables are read and converted.
+            -axes: List with the number of the variables to keep.
+        """
+        assert len(axes) > 0, "At least one variable must be selected"
+        newIter = self.copy()
+        # The results of the variables of the projection are its own
+        newIter.results = {}
+        newIter.resultLocks = {}
+        newIter.resultsLock = threading.Lock()
+        if self.projection is not None:
+            # Projection of a projection
+            axes = [self.projection[i] for i in axes]
+        newIter.projection = list(axes)
+        newIter.maxProjected = max(newIter.projection)
+        return newIter
+
+    def selectCommand(self):
+        """ Returns the sql command for retrieving the data, asking only for the projected variables """
+        if self.projection is None or not self.labels:
+            return "SELECT * FROM " + self.name
+        columns = ", ".join(self.quoteColumn(i) for i in self.projection)
+        return "SELECT " + columns + " FROM " + self.name
+
+    def scanCommand(self):
+        """ Returns the sql command, and its arguments, for retrieving the rows [startRow, endRow)
+        of the table. With a primary key, the first row is found on the index of the key and
+        the rows are read from there in order of the key; otherwise LIMIT/OFFSET is used, only
+        for the whole table (see isSeekable). """
+        sqlcmd = self.selectCommand()
+        if self.startRow == 0 and self.endRow is None:
+            return sqlcmd, None
+        # The largest LIMIT of mysql, for reading until the end of the table
+        limit = 18446744073709551615 if self.endRow is None else self.endRow - self.startRow
+        if self.primaryKey is not None:
+            key = self.quoteColumn(self.primaryKey)
+            if self.startRow == 0:
+                return sqlcmd + " ORDER BY " + key + " LIMIT %s", (limit,)
+            rows = self.query("SELECT " + key + " FROM " + self.name + " ORDER BY " + key +
+                              " LIMIT 1 OFFSET %s", (self.startRow,))
+            if not rows:
+                # Past the end of the table
+                return sqlcmd + " LIMIT 0", None
+            return sqlcmd + " WHERE " + key + " >= %s ORDER BY " + key + " LIMIT %s", (rows[0][0], limit)
+        return sqlcmd + " LIMIT %s OFFSET %s", (limit, self.startRow)
+
+    def startScan(self):
+        """ Executes the query of the rows of the scan, taking a connection if needed """
+        sqlcmd, args = self.scanCommand()
+        if self.dbConnection is None:
+            self.connect()
+        self.dbCursor.execute(sqlcmd, args)
+        self.data = self.dbCursor.fetchall_unbuffered()
+        self.scanning = True
+
+    def endScan(self):
+        """ Marks the scan as finished, all of its rows were read """
+        self.scanning = False
+        self.release()
+
+    def quoteColumn(self, axis):
+        """ Returns the name of the variable 'axis' quoted for a sql command """
+        return "`" + self.labels[axis].replace("`", "``") + "`"
+
+    def query(self, sqlcmd, args=None):
+        """ Runs a sql command on the database and returns all the rows of the result. It is meant
+        for aggregations, whose results are small, so a buffered cursor is used. """
+        assert self.sourceFlag == 0, "Not a database"
+        # On its own connection, so it does not interfere with a scan in progress
+        connection = self.pool.checkout(self.poolTimeout)
+        try:
+            cursor = connection.cursor(pymysql.cursors.Cursor)
+            cursor.execute(sqlcmd, args)
+            rows = cursor.fetchall()
+            cursor.close()
+        except:
+            self.pool.discard(connection)
+            raise
+        self.pool.checkin(connection)
+        return rows
+
+    def getColumn(self, axis):
+        """ Returns the array containing all the values of the variable 'axis'. """
+        assert self.columns is not None, "Columns not loaded"
+        return self.columns[self.realAxis(axis)]
+
+    def readColumns(self, axes):
+        """ Returns a list with an array of all the values of each variable on the list 'axes'
+        (nan on the missing values). Those are the columns when they are loaded; otherwise only
+        those variables are read, with a single pass over a projection of the data. """
+        if self.columns is not None:
+            return [self.getColumn(axis) for axis in axes]
+        source = self.project(axes)
+        batches = list(source.iterBatches())
+        source.close()
+        if not batches:
+            return [np.empty(0) for axis in axes]
+        rows = np.concatenate(batches)
+        return [np.ascontiguousarray(rows[:, i]) for i in range(len(axes))]
+
+    def getValid(self, axis):
+        """ Returns the mask of the rows whose value of the variable 'axis' is not missing. """
+        assert self.validity is not None, "Columns not loaded"
+        return np.unpackbits(self.validity[self.realAxis(axis)], count=self.totalRows).view(bool)
+
+    def nextBatch(self, n):
+        """ Returns the next 'n' rows (or less, at the end of the data) as a 2D array of
+        rows x variables. When there is no more data, the array has no rows. """
+        if self.sourceFlag == 0:
+            # For a db
+            if not self.data:
+                self.startScan()
+            if self.scanning:
+                rows = self.dbCursor.fetchmany(n)
+                if rows:
+                    return self.rowsToArray(rows)
+                self.endScan()
+            return self.emptyBatch()
+
+        elif self.sourceFlag == 1 and self.columns is not None:
+            # The rows are taken directly from the columns
+            start = self.position
+            end = min(start + n, self.totalRows)
+            if start >= end or not self.columns:
+                return self.emptyBatch()
+            columns = self.columns
+            if self.projection is not None:
+                columns = [self.columns[i] for i in self.projection]
+            batch = np.column_stack([column[start:end] for column in columns])
+            self.setDataSetPosition(end)
+            return batch
+
+        rows = []
+        try:
+            while len(rows) < n:
+                rows.append(self.next())
+        except StopIteration:
+            pass
+        if not rows:
+            return self.emptyBatch()
+        return np.array(rows, dtype=np.float64)
+
+    def iterBatches(self, size=None, maxRows=None):
+        """ Generator of 2D arrays of at most 'size' rows, from the current position until the
+        end of the data, or until 'maxRows' rows are read. """
+        if size is None:
+            size = self.batchSize
+        total = 0
+        while maxRows is None or total < maxRows:
+            # Stop if the computation was cancelled (e.g. superseded by a newer one)
+            wP.checkCancelled()
+            n = size if maxRows is None else min(size, int(maxRows - total))
+            batch = self.nextBatch(n)
+            if len(batch) == 0:
+                return
+            total += len(batch)
+            yield batch
+
+    def emptyBatch(self):
+        """ Returns a batch without rows """
+        return np.empty((0, self.numberVariables()), dtype=np.float64)
+
+    def rowsToArray(self, rows):
+        """ Converts a list of rows to a 2D array of floats, a column at a time; the missing
+        values are nan """
+        if not rows:
+            return self.emptyBatch()
+        batch, valid = cD.decodeRows(rows, self.rowConverters(len(rows[0])))
+        return self.maskMissing(batch, valid)
+
+    def getFrequencies(self, axis):
+        """ Returns a dictionary with the number of rows of each value of the variable 'axis' """
+        if self.realAxis(axis) in self.dictionaries:
+            # A single count over the codes
+            codes, table = self.dictionaries[self.realAxis(axis)]
+            counts = np.bincount(codes[self.getValid(axis)], minlength=len(table))
+            present = np.flatnonzero(counts)
+            return dict(zip(table[present].tolist(), counts[present].tolist()))
+
+        if self.columns is not None and ag.numberPartitions(self) == 1:
+            # Small enough for a single pass over the column
+            values, counts = np.unique(self.getColumn(axis)[self.getValid(axis)], return_counts=True)
+            return dict(zip(values.tolist(), counts.tolist()))
+
+        if self.sourceFlag == 0 and self.labels:
+            # Let the database count, only the distinct values are transferred
+            column = self.columnExpression(self.realAxis(axis))
+            sqlcmd = "SELECT " + column + ", COUNT(*) FROM " + self.name + " WHERE " + column + \
+                     " IS NOT NULL GROUP BY " + column
+            frequencies = {}
+            for value, count in self.query(sqlcmd):
+                value = toFloat(value)
+                if value == value:
+                    frequencies[value] = frequencies.get(value, 0) + int(count)
+            return frequencies
+
+        return self.scanAggregates([('frequencies', [axis], ())])[0]
+
+    def getHistogram(self, axis, valueRange, numBins):
+        """ Returns the list with the number of rows on each of the 'numBins' classes of equal width
+        that divide 'valueRange' ([min, max]), for the variable 'axis'. As with numpy.histogram,
+        the last class includes its upper limit. """
+        if self.columns is not None and ag.numberPartitions(self) == 1:
+            # Small enough for a single pass over the column
+            column = self.getColumn(axis)[self.getValid(axis)]
+            counts, edges = np.histogram(column, bins=numBins, range=(valueRange[0], valueRange[1]))
+            return counts.tolist()
+
+        if self.sourceFlag == 0 and self.labels:
+            # Let the database assign the classes, only one count per class is transferred
+            column = self.columnExpression(self.realAxis(axis))
+            width = (valueRange[1] - valueRange[0]) / numBins
+            if width <= 0:
+                # All the values are the same
+                width = 1.0
+            sqlcmd = "SELECT LEAST(FLOOR((" + column + " - %s) / %s), %s) AS bin, COUNT(*) FROM " + \
+                     self.name + " WHERE " + column + " BETWEEN %s AND %s GROUP BY bin"
+            rows = self.query(sqlcmd, (valueRange[0], width, numBins - 1, valueRange[0], valueRange[1]))
+            counts = [0] * numBins
+            for b, count in rows:
+                counts[min(max(int(b), 0), numBins - 1)] += int(count)
+            return counts
+
+        edges = np.linspace(valueRange[0], valueRange[1], numBins + 1)
+        return self.scanAggregates([('histogram', [axis], (edges,))])[0].tolist()
+
+    def getPairHistograms(self, pairs, ranges, numBins, rowFilter=None):
+        """ Returns an array with, for each pair of variables (a, b) on the list 'pairs', the number
+        of rows on each of the numBins x numBins classes of equal size that divide the rectangle
+        ranges[a] x ranges[b] (first index for a, second for b). All the pairs are counted with a
+        single pass over the data.
+            -ranges: The range [min, max] of each variable; the values must be inside of it.
+            -rowFilter: (variable, lower, upper) for counting only the rows with the value of the
+                        variable on [lower, upper], or None for all of them.
+        """
+        axes = sorted(set([axis for pair in pairs for axis in pair] +
+                          ([rowFilter[0]] if rowFilter is not None else [])))
+        # The variables as received by the aggregate, on the order of 'axes'
+        localPairs = [(axes.index(a), axes.index(b)) for a, b in pairs]
+        localRanges = [list(ranges[axis]) for axis in axes]
+        localFilter = None
+        if rowFilter is not None:
+            localFilter = (axes.index(rowFilter[0]), rowFilter[1], rowFilter[2])
+        args = (localPairs, localRanges, numBins, localFilter)
+
+        if self.columns is not None and ag.numberPartitions(self) == 1:
+            # Small enough for a single pass over the columns
+            batch = np.column_stack([self.getColumn(axis) for axis in axes])
+            return ag.pairHistogramPartial([batch], *args)
+
+        return self.scanAggregates([('pairhistogram', axes, args)])[0]
+
+    def columnExpression(self, axis):
+        """ Returns the sql expression for the values of the variable 'axis', NULL for the
+        values that mark a missing value """
+        expression = self.quoteColumn(axis)
+        for number in self.missingNumbers.tolist():
+            expression = "NULLIF(" + expression + ", " + repr(number) + ")"
+        return expression
+
+    def realAxis(self, axis):
+        """ Returns the number of the variable 'axis' on the data source, before any projection """
+        if self.projection is None:
+            return axis
+        return self.projection[axis]
+
+    def isSeekable(self):
+        """ Returns True if the data can be read starting at any row, so it can be split
+        in partitions read in parallel. """
+        if self.sourceFlag == 0:
+            # Without a key, the order of the rows could differ between the queries of the
+            # partitions, which could overlap or miss rows
+            return self.pool is not None and self.primaryKey is not None
+        if self.sourceFlag == 1:
+            return self.offsets is not None
+        # A stream can only be read in order
+        return False
+
+    def getStatistics(self):
+        """ Returns a list with the statistics (columnStats.ColumnStatistics) of each variable.
+        They are computed with a single pass over the data the first time they are requested,
+        and shared by all the plots afterwards. """
+        statistics = self.results.get('statistics')
+        if statistics is not None:
+            return statistics
+        with self.resultLock('statistics'):
+            # Computed by a single thread, the others wait for them
+            if 'statistics' not in self.results:
+                self.setStatistics(self.computeStatistics())
+            return self.results['statistics']
+
+    def resultLock(self, name):
+        """ Returns the lock held while the result 'name' is computed, shared by the cursors """
+        with self.resultsLock:
+            if name not in self.resultLocks:
+                self.resultLocks[name] = threading.RLock()
+            return self.resultLocks[name]
+
+    def setStatistics(self, statistics):
+        """ Keeps the statistics of the variables, shared by all the plots """
+        for stats in statistics:
+            stats.droppedCount = self.droppedRows
+        self.results['statistics'] = statistics
+
+    def scansForStatistics(self):
+        """ Returns True if computing the statistics requires a pass over the rows, that is,
+        they are not computed on memory nor by the database. """
+        if self.columns is not None and ag.numberPartitions(self) == 1:
+            return False
+        return not (self.sourceFlag == 0 and self.labels)
+
+    def scanAggregates(self, requests):
+        """ Returns the list of results of several aggregates (see aggregation.computeMany),
+        computed with a single pass over the data. If the statistics of the variables are
+        not known yet, and would require a pass of their own, they are computed on the same
+        pass and kept. """
+        if 'statistics' not in self.results and self.projection is None and self.scansForStatistics():
+            with self.resultLock('statistics'):
+                # getStatistics waits for this pass instead of making its own
+                if 'statistics' not in self.results:
+                    statistics = ('statistics', list(range(self.length)), (self.length,))
+                    results = ag.computeMany(self, [statistics] + list(requests))
+                    self.setStatistics(results[0])
+                    return results[1:]
+        return ag.computeMany(self, requests)
+
+    def computeStatistics(self):
+        """ Computes the statistics of all the variables (of the projection, if any) with a single
+        pass over the data """
+        if self.columns is not None and ag.numberPartitions(self) == 1:
+            statistics = []
+            for axis in range(self.numberVariables()):
+                stats = cS.ColumnStatistics()
+                stats.update(self.getColumn(axis))
+                statistics.append(stats)
+            return statistics
+
+        if self.sourceFlag == 0 and self.labels:
+            return self.queryStatistics()
+
+        return ag.compute(self, 'statistics', self.numberVariables())
+
+    def queryStatistics(self):
+        """ Computes the statistics of all the variables with a single aggregation query on the
+        database. The quantiles are not computed here, see getQuantile. """
+        axes = range(self.length) if self.projection is None else self.projection
+        aggregates = []
+        for axis in axes:
+            column = self.columnExpression(axis)
+            aggregates.append("COUNT(%s), MIN(%s), MAX(%s), AVG(%s), STDDEV_POP(%s), COUNT(DISTINCT %s)" %
+                              ((column,) * 6))
+        sqlcmd = "SELECT COUNT(*), " + ", ".join(aggregates) + " FROM " + self.name
+        row = self.query(sqlcmd)[0]
+        total = int(row[0])
+        statistics = []
+        for i in range(len(aggregates)):
+            count, minimum, maximum, mean, std, distinct = row[1 + 6 * i:7 + 6 * i]
+            minimum, maximum, mean, std = [toFloat(v) for v in (minimum, maximum, mean, std)]
+            if count and (minimum != minimum or maximum != maximum):
+                # Not a numeric variable
+                count = 0
+            statistics.append(cS.fromAggregates(count, total - int(count), minimum, maximum, mean, std, distinct))
+        return statistics
+
+    def getCorrelations(self):
+        """ Returns the matrix of the correlation coefficients of all the pairs of variables
+        (nan where a variable is constant). It is computed with a single pass over the data the
+        first time it is requested, and shared by all the plots afterwards. """
+        correlations = self.results.get('correlations')
+        if correlations is not None:
+            return correlations
+        with self.resultLock('correlations'):
+            if 'correlations' not in self.results:
+                axes = list(range(self.dataLength()))
+                moments = self.scanAggregates([('comatrix', axes, ())])[0]
+                if moments is None:
+                    # No rows
+                    self.results['correlations'] = np.full((len(axes), len(axes)), np.nan)
+                else:
+                    self.results['correlations'] = moments.correlation()
+            return self.results['correlations']
+
+    def getQuantile(self, axis, q):
+        """ Returns the q-quantile of the variable 'axis'. It comes from the statistics; for a
+        database, where the statistics have no sketch of the values, the database is asked for
+        the value at that rank, and the result is kept along the statistics. """
+        stats = self.getStatistics()[axis]
+        if q in stats.knownQuantiles or stats.quantiles.count > 0 or stats.count == 0:
+            return stats.quantile(q)
+        if self.sourceFlag == 0 and self.labels:
+            column = self.columnExpression(self.realAxis(axis))
+            rank = min(int(q * (stats.count - 1)), stats.count - 1)
+            sqlcmd = "SELECT " + column + " FROM " + self.name + " WHERE " + column + \
+                     " IS NOT NULL ORDER BY " + column + " LIMIT 1 OFFSET %s"
+            rows = self.query(sqlcmd, (rank,))
+            stats.knownQuantiles[q] = toFloat(rows[0][0]) if rows else float('nan')
+        return stats.quantile(q)
+
     def getNumberRows(self):
         """ Returns the number of rows on the data set. """
         return self.totalRows
 
-    def setDataSetPosition(self, pos):
-        """ Move the position of the data to the position specified by pos. """
+    def setDataSetPosition(self, pos, end=None):
+        """ Move the position of the data to the position specified by pos.
+            -end: For a database, the row where the scan stops (the end of the table if None),
+                  so only the rows of a partition are sent by the server.
+        """
         if pos < 0 or pos > self.totalRows:
             return
+        if self.sourceFlag == 0:
+            self.release()
+            self.startRow = int(pos)
+            self.endRow = None if end is None else int(end)
+            # The query is executed again on the next read
+            self.data = None
         if self.sourceFlag == 1:
-            self.File.seek(int(pos * self.lenRow), 0)
-            line = next(self.File)
-            del line
+            pos = int(pos)
+            self.position = pos
+            if pos < self.totalRows:
+                self.File.seek(int(self.offsets[pos]), 0)
+            else:
+                self.File.seek(0, 2)
 
     def rewind(self):
-        """ Return to the first data """
+        """ Return to the first data; only this cursor is moved """
         if self.sourceFlag == 0:
-            self.dbCursor.close()
-            self.dbCursor = self.dbConnection.cursor()
-            sqlcmd = "SELECT * FROM " + self.name
-            self.dbCursor.execute(sqlcmd)
-            self.data = self.dbCursor.fetchall_unbuffered()
+            self.release()
+            self.startRow = 0
+            self.endRow = None
+            # The query is executed again on the next read
+            self.data = None
 
         if self.sourceFlag == 1:
             self.File.seek(0, 0)
+            self.position = 0
 
         if self.sourceFlag == 2:
             # Stream in use, no possible to rewind
             return
 
+    def cursor(self):
+        """ Returns a new cursor over the data, at the first row. It shares the data with this one
+        (the columns, the results computed once, the connections) but has its own position, so
+        both can be read at the same time. A stream can only be read once, it is its own cursor. """
+        if self.sourceFlag == 2:
+            return self
+        return self.copy()
+
     def copy(self):
         """ Returns a copy of the iterator """
         newIter = Data(self.sourceFlag)
         newIter.name = self.name
         newIter.totalRows = self.totalRows
-        newIter.lenRow = self.lenRow
+        newIter.offsets = self.offsets
+        # The arrays are read only, share them
+        newIter.columns = self.columns
+        newIter.length = self.length
+        newIter.labels = self.labels
+        newIter.category = self.category
+        newIter.converters = self.converters
+        newIter.results = self.results
+        newIter.resultLocks = self.resultLocks
+        newIter.resultsLock = self.resultsLock
+        newIter.dictionaries = self.dictionaries
+        newIter.validity = self.validity
+        newIter.shared = self.shared
+        newIter.sharedLock = self.sharedLock
+        newIter.droppedRows = self.droppedRows
+        newIter.missingValues = self.missingValues
+        newIter.missingNumbers = self.missingNumbers
+        newIter.projection = self.projection
+        newIter.maxProjected = self.maxProjected
 
         if self.sourceFlag == 0:
-            newIter.dbConnection = self.dbConnection
-            newIter.dbCursor = newIter.dbConnection.cursor()
+            # Each copy takes its own connection from the pool when it is first used (on the
+            # process of a worker), so the scans do not interfere with each other
+            newIter.pool = self.pool
+            newIter.primaryKey = self.primaryKey
         
         if self.sourceFlag == 1:
             newIter.File = open(self.name, 'r')
 
         return newIter
 
+    def __getstate__(self):
+        """ Returns the state sent to a worker: the description of the data source, without the
+        open files, connections and threads. The columns and the index of the rows are not
+        copied: the worker maps the files of the cache, or attaches to a copy of them on shared
+        memory. """
+        state = self.__dict__.copy()
+        for key in ['File', 'descrFile', 'dbConnection', 'dbCursor', 'data', 'stream', 'exitQ',
+                    'exitQLock', 'workQueue', 'workQLock', 'thread', 'converterCache',
+                    'resultsLock', 'sharedLock']:
+            state[key] = None
+        for key in ['columns', 'validity', 'results', 'resultLocks', 'shared']:
+            state[key] = None
+        state['columnsDescriptor'] = None
+        if self.columns is not None:
+            state['columnsDescriptor'] = self.columnsDescriptor()
+            state['offsets'] = None
+        state['dictionaries'] = {}
+        state['scanning'] = False
+        state['ownsPool'] = False
+        state['ownsShared'] = False
+        return state
+
+    def __setstate__(self, state):
+        """ Restores the state on a worker, opening the file again and attaching the columns """
+        kind, descriptor = state.pop('columnsDescriptor') or (None, None)
+        self.__dict__.update(state)
+        self.results = {}
+        self.resultLocks = {}
+        self.resultsLock = threading.Lock()
+        self.shared = {}
+        self.sharedLock = threading.Lock()
+        if kind == 'files':
+            self.columns = [np.load(filename, mmap_mode='r') for filename in descriptor[0]]
+            self.validity = [np.load(filename, mmap_mode='r') for filename in descriptor[1]]
+            if descriptor[2] is not None:
+                self.offsets = np.load(descriptor[2], mmap_mode='r')
+        elif kind == 'shared':
+            # Detached when the cursor is closed, at the end of the partition
+            self.shared['attached'] = descriptor
+            arrays = sA.attach(descriptor)
+            for array in arrays:
+                array.flags.writeable = False
+            n = len(arrays) // 2
+            self.columns = arrays[:n]
+            self.validity = arrays[n:2 * n]
+            if len(arrays) % 2:
+                # The index of the rows, after the columns and their validity
+                self.offsets = arrays[-1]
+        if self.sourceFlag == 1 and self.name:
+            self.File = open(self.name, 'r')
+
+    def columnsDescriptor(self):
+        """ Returns how a worker can reach the columns, their validity and the index of the rows
+        without copying them: the files of the cache when they are mapped from it, or else a
+        block of shared memory with a copy of them, created the first time. """
+        arrays = self.columns + self.validity + ([self.offsets] if self.offsets is not None else [])
+        if all(isinstance(array, np.memmap) and array.filename for array in arrays):
+            offsets = self.offsets.filename if self.offsets is not None else None
+            return ('files', ([c.filename for c in self.columns], [v.filename for v in self.validity], offsets))
+        with self.sharedLock:
+            # Created once, even if several threads send the data to the workers
+            if 'columns' not in self.shared:
+                self.shared['columns'] = sA.create(arrays)
+            return ('shared', self.shared['columns'].descriptor())
+
     def close(self):
         """ Close the appropiate variables """
         if self.File:
             self.File.close()
-        if self.dbConnection and self.dbCursor:
-            self.dbCursor.close()
-            self.dbConnection.close()
+        if self.ownsShared and 'columns' in self.shared:
+            self.shared.pop('columns').close()
+        if 'attached' in self.shared:
+            # The arrays are views of the block attached by this worker
+            self.columns = None
+            self.validity = None
+            self.offsets = None
+            sA.detach(self.shared.pop('attached'))
+        if self.pool:
+            self.release()
+            if self.ownsPool:
+                self.pool.close()
         if self.stream and self.thread:
             self.exitQLock.acquire(blocking=False)
             self.exitQ.put(1)
@@ -387,3 +1165,18 @@ class Data(object):
             # Wait to thread to finish
             t.sleep(1)
             self.stream.close()
+
+def storedMissingValues(filename):
+    """ Returns the values that marked a missing value the last time the csv 'filename' was
+    loaded (kept on its cache), or None if it has no valid cache """
+    cache = cC.ColumnCache(filename, filename.split('.csv')[0] + '_descr.csv')
+    if cache.isValid():
+        return cache.getMeta('missingValues')
+    return None
+
+def toFloat(value):
+    """ Returns the value as a float, nan if it is not a number """
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return float('nan')
@@ -15,7 +15,8 @@ from OpenGL.GLUT import *
 # OpenGL canvas
 import oglCanvas as oglC
 
-from multiprocessing import Process, Queue, Lock
+# Computations on the background
+import backgroundJobs as bJ
 
 class HistogramPlot(oglC.OGLCanvas):
     """
@@ -41,6 +42,8 @@ class HistogramPlot(oglC.OGLCanvas):
         self.range = []
         self.rect = []
         self.maxFrequency = 0
+        # If all the values of the variable are missing
+        self.noValues = False
         self.axis = -1
         self.axisName = ''
         self.data = []
@@ -69,6 +72,13 @@ class HistogramPlot(oglC.OGLCanvas):
         glutInit(sys.argv)
 
     def OnDraw(self):
+        if self.noValues:
+            self.DrawMessage("No values to display")
+            return
+        if not self.rect:
+            # The frequencies are not computed yet
+            self.DrawMessage("Computing...")
+            return
         glClear(GL_COLOR_BUFFER_BIT)
 
         #Draw rectangles and axes
@@ -108,13 +118,14 @@ class HistogramPlot(oglC.OGLCanvas):
         # Interior of the rectangles
         glColor4f(0.0, 0.36, 0.9, 0.8)
         glPolygonMode(GL_FRONT, GL_FILL)
-        for i in range(self.numBins):
-            glRectfv(self.rect[i][0], self.rect[i][1])
+        # The rectangles may be those of the previous number of bins, until the new ones are computed
+        for rect in self.rect:
+            glRectfv(rect[0], rect[1])
         # Contour
         glColor3f(0.0, 0.0, 1.0)
         glPolygonMode(GL_FRONT, GL_LINE)
-        for i in range(self.numBins):
-            glRectfv(self.rect[i][0], self.rect[i][1])
+        for rect in self.rect:
+            glRectfv(rect[0], rect[1])
 
     def DrawFreqPol(self):
         """Draws the frequency polygone"""
@@ -147,79 +158,54 @@ class HistogramPlot(oglC.OGLCanvas):
         """ Stores a reference to the data in use """
         # Store a reference
         self.data = data
-        # Set the range
+
+    def loadStatistics(self):
+        """
+        Computes what the classes depend on: the statistics of the data and the quartiles of
+        the variable. It runs on the background; afterwards they are taken from the data.
+        """
+        self.data.getStatistics()
+        self.data.getQuantile(self.axis, 0.25)
+        self.data.getQuantile(self.axis, 0.75)
+
+    def computeFrequencies(self, delay=0):
+        """
+        Compute the frequencies of the histogram, on the background. The previous histogram
+        is displayed until they are computed, see setFrequencies. A computation still running
+        for the previous number of bins is cancelled.
+            -delay: Milliseconds to wait for other changes before starting.
+        """
         if self.category == 0:
-            self.setRange()
+            # Number of rows on each class; pushed to the data source when possible
+            function, args = self.data.getHistogram, (self.axis, list(self.range), self.numBins)
+        else:
+            # Number of rows of each category
+            function, args = self.data.getFrequencies, (self.axis,)
+        bJ.schedule(self, function, args, self.setFrequencies, delay=delay)
 
-    def computeFrequencies(self, draw):
+    def setFrequencies(self, frequencies):
         """
-        Compute the frequencies of the histogram. Such frequencies could not be in the range [0, 1],
-        so it normalize them. Such frequency is the height of the rectangle. If the number of 
+        Sets the frequencies computed. Such frequencies could not be in the range [0, 1], so it
+        normalize them. Such frequency is the height of the rectangle. If the number of
         frequencies is different to the number of bins, the latter is updated.
         """
-        def parallelCompute(data, axis, category, intervals, startPosition, endPosition, q, lock):
-            data.setDataSetPosition(startPosition)
-            total = 0
-            if category == 0:
-                f = []
-                for i in range(len(intervals)):
-                    f.append(0)
-                for x in data:
-                    i = 0
-                    for interval in intervals:
-                        if interval[0] <= x[axis] <= interval[1]:
-                            f[i] += 1
-                            break
-                        i += 1
-                    total += 1
-                    if total >= (endPosition - startPosition):
-                        break
-            else:
-                f = {}
-                for x in data:
-                    f[x[axis]] = f.get(x[axis], 0) + 1
-                    total += 1
-                    if total >= (endPosition - startPosition):
-                        break
-            lock.acquire()
-            q.put(f)
-            lock.release()
-
-        # Create a queue
-        q = Queue()
-        qLock = Lock()
-        nRow = self.data.getNumberRows()
-        p1 = Process(target=parallelCompute, args=(self.data.copy(), self.axis, self.category, self.binIntervals, 0.0, nRow / 3.0, q, qLock))
-        p2 = Process(target=parallelCompute, args=(self.data.copy(), self.axis, self.category, self.binIntervals, nRow / 3.0, (2 * nRow) / 3.0, q, qLock))
-        p3 = Process(target=parallelCompute, args=(self.data.copy(), self.axis, self.category, self.binIntervals, (2 * nRow) / 3.0, nRow, q, qLock))
-        # Compute absolute frequencies
-        # Start threads
-        p1.start()
-        p2.start()
-        p3.start()
-        # Wait for threads
-        p1.join()
-        p2.join()
-        p3.join()
-
+        if not self:
+            # The plot was closed
+            return
         if self.category == 0:
-            self.initFrequencies()
-            while not q.empty():
-                result = q.get()
-                i = 0
-                for r in result:
-                    self.frequencies[i] += r
-                    i += 1
+            self.frequencies = frequencies
 
+        elif not frequencies:
+            # All the values of the variable are missing: there are no categories to draw
+            self.noValues = True
+            wx.PostEvent(self.GetEventHandler(), wx.PyCommandEvent(wx.EVT_PAINT.typeId, self.GetId()))
+            return
         else:
-            f = {}
-            while not q.empty():
-                result = q.get()
-                for r in result:
-                    f[r] = f.get(r, 0) + result[r]
+            f = frequencies
             self.frequencies.clear()
             self.SetNumBins(len(f))
             self.initFrequencies()
+            self.values = []
             i = 0
             for d in f:
                 self.frequencies[i] = f[d]
@@ -233,8 +219,10 @@ class HistogramPlot(oglC.OGLCanvas):
             if f > self.maxFrequency:
                 self.maxFrequency = f
         
-        for i in range(len(self.frequencies)):
-            self.frequencies[i] /= self.maxFrequency
+        if self.maxFrequency > 0:
+            # Zero when all the values are missing
+            for i in range(len(self.frequencies)):
+                self.frequencies[i] /= self.maxFrequency
 
         # Update rectangles and redraw
         self.UpdateRect()
@@ -242,55 +230,16 @@ class HistogramPlot(oglC.OGLCanvas):
         # https://stackoverflow.com/questions/747781/wxpython-calling-an-event-manually
         # https://www.blog.pythonlibrary.org/2010/05/22/wxpython-and-threads/
         # https://stackoverflow.com/questions/25299745/how-to-programmatically-generate-an-event-in-wxpython
-        if draw:
-            wx.PostEvent(self.GetEventHandler(), wx.PyCommandEvent(wx.EVT_PAINT.typeId, self.GetId()))
-        self.data.rewind()
+        wx.PostEvent(self.GetEventHandler(), wx.PyCommandEvent(wx.EVT_PAINT.typeId, self.GetId()))
     
     def setRange(self):
         """
-        Set the range of the x axis
+        Set the range of the x axis, taken from the statistics of the data
         """
-        def parallelComputeR(data, axis, startPosition, endPosition, lock, q):
-            """ Get the maximum and minimum of the axis """
-            data.setDataSetPosition(startPosition)
-            minR, maxR = float('inf'), -float('inf')
-            total = 0
-            for d in data:
-                if d[axis] < minR:
-                    minR = d[axis]
-                if maxR < d[axis]:
-                    maxR = d[axis]
-                total += 1
-                if total >= endPosition - startPosition:
-                    break
-            lock.acquire()
-            q.put([minR, maxR])
-            lock.release()
-        #
-        q = Queue()
-        lock = Lock()
-        nRow = self.data.getNumberRows()
-        p1 = Process(target=parallelComputeR, args=(self.data.copy(), self.axis, 0.0, nRow / 3.0, lock, q))
-        p2 = Process(target=parallelComputeR, args=(self.data.copy(), self.axis, nRow / 3.0, (2 * nRow) / 3.0, lock, q))
-        p3 = Process(target=parallelComputeR, args=(self.data.copy(), self.axis, (2 * nRow) / 3.0, nRow, lock, q))
-        # Start threads
-        p1.start()
-        p2.start()
-        p3.start()
-        # Wait for threads
-        p1.join()
-        p2.join()
-        p3.join()
-
-        minR, maxR = float('inf'), -float('inf')
-        while not q.empty():
-            result = q.get()
-            if result[0] < minR:
-                minR = result[0]
-            if maxR < result[1]:
-                maxR = result[1]
-        self.range = [minR, maxR]
-        self.data.rewind()
+        stats = self.data.getStatistics()[self.axis]
+        self.noValues = stats.count == 0
+        # Without values there is no range, nor classes
+        self.range = [] if self.noValues else stats.getRange()
 
     def setUnits(self, unit):
         """ Sets the units of the variable """
@@ -318,58 +267,23 @@ class HistogramPlot(oglC.OGLCanvas):
 
     def computeBins(self):
         """
-        Computes the number of classes based on the formula by Freedman-Diaconis:
-            c = 2(IQ)*n^-1/3
-        where IQ is the interquartile range, and n is the number of data
+        Computes the number of classes based on the formula by Freedman-Diaconis for the width:
+            h = 2(IQR)*n^-1/3
+        where IQR is the interquartile range, and n is the number of data. The number of classes is
+        the range of the data divided by h. The quartiles come from the quantile sketch of the
+        statistics of the data (or from the database), so no additional pass is required.
         """
-
+        stats = self.data.getStatistics()[self.axis]
         # Get the number of points
-        n = self.data.getNumberRows()
-        # Compute quartiles
-        fQpos = ( (n - 1) / 4 ) + 1
-        tQpos = ( 3 * (n - 1) / 4 ) + 1
-        # Compute the quartiles
-        firstQ = 0.0
-        thirdQ = 0.0
-        # First quartile
-        if fQpos == round(fQpos):
-            i = 0
-            for row in self.data:
-                i += 1
-                if i >= int(fQpos):
-                    break
-            firstQ = row[self.axis]
-        else:
-            i = 0
-            up = round(fQpos)
-            for row in self.data:
-                i += 1
-                if i >= up - 1:
-                    break
-            row2 = next(self.data)
-            firstQ = row[self.axis] + ( (row2[self.axis] - row[self.axis]) / 4.0 )
-
-        self.data.rewind()
-        # Third quartile
-        if tQpos == round(tQpos):
-            i = 0
-            for row in self.data:
-                i += 1
-                if i >= int(tQpos):
-                    break
-            thirdQ = row[self.axis]
+        n = stats.count
+        IQR = self.data.getQuantile(self.axis, 0.75) - self.data.getQuantile(self.axis, 0.25)
+        width = 2 * IQR * m.pow(n, -1/3) if n > 0 else 0.0
+        if width > 0:
+            numB = int(m.ceil((stats.max - stats.min) / width))
         else:
-            up = round(tQpos)
-            for row in self.data:
-                i += 1
-                if i >= up - 1:
-                    break
-            row2 = next(self.data)
-            thirdQ = row[self.axis] + ( 3 * ( row2[self.axis] - row[self.axis]) / 4.0 )
-        # Compute IQR
-        IQR = thirdQ - firstQ
-        self.data.rewind()
-        numB = int(2 * IQR * m.pow(n, -1/3)) + 1
+            numB = 1
+        # Keep it within the limits of the slider
+        numB = min(max(numB, 1), self.getMaxBins())
         self.SetNumBins(numB)
 
         assert self.numBins > 0, "Bins not set"
@@ -406,7 +320,6 @@ class HistogramPlot(oglC.OGLCanvas):
             interval = [lower, upper]
             self.binIntervals.append(interval.copy())
             del interval
-        self.data.rewind()
 
     def getMaxBins(self):
         """ Return the maximum number of bins """
@@ -536,6 +449,9 @@ class HistogramWidget(wx.Panel):
     """
     The panel containing the histogram plot and all of its controls
     """
+    # Milliseconds without changes of the number of bins before computing the frequencies
+    debounceDelay = 250
+
     def __init__(self, parent):
         super(HistogramWidget, self).__init__(parent, style=wx.RAISED_BORDER)
 
@@ -576,9 +492,9 @@ class HistogramWidget(wx.Panel):
         self.histogram.setCategory(self.category[self.axis])
         self.histogram.setData(self.data)
         if self.category[self.axis] == 0:
-            # Compute the defaul number of bins
-            self.histogram.computeBins()
-            self.histogram.computeClassesInterval()
+            # The default number of bins, once the statistics are computed
+            histogram = self.histogram
+            bJ.schedule(histogram, histogram.loadStatistics, (), lambda result: self.onStatistics(histogram))
         else:
             self.values.clear()
             self.names.clear()
@@ -589,10 +505,26 @@ class HistogramWidget(wx.Panel):
                 self.values.append(int(value))
                 self.names.append(name)
             self.histogram.setDescription(self.values, self.names)
-    
-        self.histogram.computeFrequencies(False)
+            self.histogram.computeFrequencies()
         self.histogram.setUnits(self.units[self.axis])
 
+    def onStatistics(self, histogram):
+        """ When the statistics are computed for 'histogram': set the range and the default number
+        of bins, and compute the frequencies """
+        if not self or self.histogram is not histogram:
+            # The widget was closed, or shows another variable
+            return
+        self.histogram.setRange()
+        if self.histogram.noValues:
+            wx.PostEvent(self.histogram.GetEventHandler(), wx.PyCommandEvent(wx.EVT_PAINT.typeId, self.histogram.GetId()))
+            return
+        self.histogram.computeBins()
+        self.histogram.computeClassesInterval()
+        bins = self.histogram.getNumBins()
+        self.slBins.SetValue(bins)
+        self.tbxBins.ChangeValue(str(bins))
+        self.histogram.computeFrequencies()
+
     def initCtrls(self):
         """
         Initializer the gui controls for the histogram
@@ -604,7 +536,7 @@ class HistogramWidget(wx.Panel):
             # For selecting the number of bins
             self.binsLabel = wx.StaticText(self, -1, "Bins:")
             self.tbxBins = wx.TextCtrl(self, -1, size=(50, 25))
-            self.slBins = wx.Slider(self, -1, value=bins, minValue=0,
+            self.slBins = wx.Slider(self, -1, value=bins, minValue=1,
                 maxValue=maxBins, name="Bins", style=wx.SL_HORIZONTAL | wx.SL_LABELS | wx.SL_AUTOTICKS)
             #
             self.SetSldMaxValue(maxBins)
@@ -639,7 +571,8 @@ class HistogramWidget(wx.Panel):
         """
         if self.category[self.axis] == 0:
             self.Bind(wx.EVT_TEXT, self.OnTxtChange, self.tbxBins)
-            self.Bind(wx.EVT_SCROLL_THUMBRELEASE, self.OnSldScroll, self.slBins)
+            # While dragging too, the computations are debounced
+            self.Bind(wx.EVT_SCROLL, self.OnSldScroll, self.slBins)
 
     def SetSldMaxValue(self, value):
         self.sliderMaxValue = value
@@ -682,13 +615,18 @@ class HistogramWidget(wx.Panel):
     def updateHistFreqs(self, bins):
         """ When the number of bins change"""
         assert type(bins) is int, "Incorrect type"
+        if not self.histogram.range or bins < 1 or bins == self.histogram.getNumBins():
+            # The statistics are not computed yet, there are no classes, or nothing changed
+            return
 
         # Set the bins
         self.histogram.SetNumBins(bins)
         self.histogram.computeClassesInterval()
-        self.histogram.computeFrequencies(True)
+        self.histogram.computeFrequencies(self.debounceDelay)
 
     def close(self):
         """ Close all controls """
+        if self.histogram:
+            bJ.cancel(self.histogram)
         self.DestroyChildren()
         self.histogram = None
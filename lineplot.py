@@ -25,10 +25,11 @@ import math as m
 
 import random as r
 
-from multiprocessing import Process, Queue, Lock
-
 import operator
 
+# Computations on the background
+import backgroundJobs as bJ
+
 # Auxiliary functions        
 def isSort(data):
     """ Verifies if the array is sorted """
@@ -65,6 +66,8 @@ class LinePlot(oglC.OGLCanvas):
         self.maxL = 0
         self.colors = []
         self.lineLength = 0.0
+        # Axis of each line being computed, by the key of its job
+        self.pending = {}
 
         self.initGrid()
 
@@ -103,6 +106,10 @@ class LinePlot(oglC.OGLCanvas):
 
             return length
         #
+        if not self.data:
+            # The frequencies are not computed yet
+            self.DrawMessage("Computing...")
+            return
         glClear(GL_COLOR_BUFFER_BIT)
 
         glMatrixMode(GL_PROJECTION)
@@ -184,119 +191,66 @@ class LinePlot(oglC.OGLCanvas):
             glEnd()
         del data
 
-    def setData(self, ndata, axis):
+    def setData(self, ndata, axis, name):
         """ Set the data of the line plot. data is an array containing the 
-        values of the axis on which the frequencies are calculated.
+        values of the axis on which the frequencies are calculated. The frequencies are computed
+        on the background (see addLine); a computation for the previous axis is cancelled.
             -ndata: The new data.
+            -name: The name of the variable, shown once its line is drawn.
         """
-        # Compute the frequencies
-        q = Queue()
-        lock = Lock()
-        nRow = ndata.getNumberRows()
-        p1 = Process(target=self.parallelCompute, args=(ndata.copy(), axis, 0.0, nRow / 3.0, lock, q))
-        p2 = Process(target=self.parallelCompute, args=(ndata.copy(), axis, nRow / 3.0, (2 * nRow) / 3.0, lock, q))
-        p3 = Process(target=self.parallelCompute, args=(ndata.copy(), axis, (2 * nRow) / 3.0, nRow, lock, q))
-        # Start threads
-        p1.start()
-        p2.start()
-        p3.start()
-        # Wait for threads
-        p1.join()
-        p2.join()
-        p3.join()
-
-        dataFreq = {}
-        last = None
-        # Merge results
-        while not q.empty():
-            result = q.get()
-            for d in result:
-                dataFreq[d] = dataFreq.get(d, 0) + result[d]
-                last = d
-            del result
-
-        ndata.rewind()
-
+        self.scheduleLine(self, ndata, axis, name)
+
+    def scheduleLine(self, key, ndata, axis, name):
+        """ Computes on the background the frequencies of the axis, for a new line """
+        self.pending[key] = axis
+        bJ.schedule(key, self.computeFrequencies, (ndata, axis),
+                    lambda dataFreq: self.addLine(key, ndata, axis, name, dataFreq))
+
+    def computeFrequencies(self, ndata, axis):
+        """ Compute the frequencies of each value of the axis, and the statistics of the data
+        (on the same pass over the data, when possible). Run on the background.
+            -ndata: The data.
+            -axis: The axis to analyze.
+        """
+        dataFreq = ndata.getFrequencies(axis)
+        ndata.getStatistics()
+        return dataFreq
+
+    def addLine(self, key, ndata, axis, name, dataFreq):
+        """ Adds the line of the frequencies computed for the axis, normalized by the maximum
+        frequency, and its name """
+        if not self:
+            # The plot was closed
+            return
+        del self.pending[key]
+        if not dataFreq:
+            # All the values of the variable are missing: there is no line to draw
+            return
         # Get the max value
-        self.maxFreq = dataFreq[last]
-        self.minFreq = dataFreq[last]
-        for d in dataFreq:
-            if dataFreq[d] > self.maxFreq:
-                self.maxFreq = dataFreq[d]
-            if dataFreq[d] < self.minFreq:
-                self.minFreq = dataFreq[d]
+        self.maxFreq = max(dataFreq.values())
+        self.minFreq = min(dataFreq.values())
         # Normalize the frequencies
         for d in dataFreq:
             dataFreq[d] /= self.maxFreq
 
+        if not self.data:
+            # The first line
+            self.numClass = len(dataFreq)
+            self.colors.append([0.0, 0.4, 0.6])
+        else:
+            self.numClass = max(self.numClass, len(dataFreq))
+            self.colors.append([r.random(), r.random(), r.random()])
         self.data.append(dataFreq)
+        self.name.append(name)
         self.axes.append(axis)
         self.setRange(ndata)
-        self.numClass = len(dataFreq)
-        self.colors.append([0.0, 0.4, 0.6])
-        del dataFreq
-
-    def parallelCompute(self, data, axis, startPosition, endPosition, lock, q):
-        """ Compute the frequencies in a parallel manner """
-        data.setDataSetPosition(int(startPosition))
-        frequencies = {}
-        total = 0
-        # Compute frequencies
-        for row in data:
-            d = row[axis]
-            del row
-            frequencies[d] = frequencies.get(d, 0) + 1
-            total += 1
-            if total >= endPosition - startPosition:
-                break
-        # Put data on queue
-        lock.acquire()
-        q.put(frequencies)
-        lock.release()
+        self.reDraw()
 
     def setRange(self, data):
         """
-        Set the range of the x axis
+        Set the range of the x axis, taken from the statistics of the data
         """
-        def parallelComputeR(data, axis, startPosition, endPosition, lock, q):
-            """ Get the maximum and minimum of the axis """
-            data.setDataSetPosition(startPosition)
-            minR = maxR = next(data)[axis]
-            total = 0
-            for d in data:
-                if d[axis] < minR:
-                    minR = d[axis]
-                if maxR < d[axis]:
-                    maxR = d[axis]
-                total += 1
-                if total >= endPosition - startPosition:
-                    break
-            lock.acquire()
-            q.put([minR, maxR])
-            lock.release()
-        #
-        q = Queue()
-        lock = Lock()
-        nRow = data.getNumberRows()
-        p1 = Process(target=parallelComputeR, args=(data.copy(), self.axes[-1], 0.0, nRow / 3.0, lock, q))
-        p2 = Process(target=parallelComputeR, args=(data.copy(), self.axes[-1], nRow / 3.0, (2 * nRow) / 3.0, lock, q))
-        p3 = Process(target=parallelComputeR, args=(data.copy(), self.axes[-1], (2 * nRow) / 3.0, nRow, lock, q))
-        # Start threads
-        p1.start()
-        p2.start()
-        p3.start()
-        # Wait for threads
-        p1.join()
-        p2.join()
-        p3.join()
-
-        minR, maxR = float('inf'), -float('inf')
-        while not q.empty():
-            result = q.get()
-            if result[0] < minR:
-                minR = result[0]
-            if maxR < result[1]:
-                maxR = result[1]
+        minR, maxR = data.getStatistics()[self.axes[-1]].getRange()
 
         if not self.range:
             self.range = [minR, maxR]
@@ -311,61 +265,14 @@ class LinePlot(oglC.OGLCanvas):
 
         assert len(self.range) == 2, "Incorrect len of range"
 
-    def addNewLine(self, ndata, axis):
+    def addNewLine(self, ndata, axis, name):
         """ Add a new line to draw """
-        assert type(ndata) is list, "Incorrect input type"
-        
-        for ax in self.axes:
-            if ax == axis:
-                return
+        if axis in self.axes or axis in self.pending.values():
+            # Drawn, or being computed
+            return
 
         # Compute the frequencies
-        q = Queue()
-        lock = Lock()
-        nRow = ndata.getNumberRows()
-        p1 = Process(target=self.parallelCompute, args=(ndata.copy(), axis, 0.0, nRow / 3.0, lock, q))
-        p2 = Process(target=self.parallelCompute, args=(ndata.copy(), axis, nRow / 3.0, (2 * nRow) / 3.0, lock, q))
-        p3 = Process(target=self.parallelCompute, args=(ndata.copy(), axis, (2 * nRow) / 3.0, nRow, lock, q))
-        # Start threads
-        p1.start()
-        p2.start()
-        p3.start()
-        # Wait for threads
-        p1.join()
-        p2.join()
-        p3.join()
-
-        dataFreq = {}
-        last = None
-        # Merge results
-        while not q.empty():
-            result = q.get()
-            for d in result:
-                dataFreq[d] = dataFreq.get(d, 0) + result[d]
-                last = d
-            del result
-        ndata.rewind()
-
-        # Get the max value
-        self.maxFreq = dataFreq[last]
-        self.minFreq = dataFreq[last]
-        for d in dataFreq:
-            if dataFreq[d] > self.maxFreq:
-                self.maxFreq = dataFreq[d]
-            if dataFreq[d] < self.minFreq:
-                self.minFreq = dataFreq[d]
-        # Normalize the frequencies
-        for d in dataFreq:
-            dataFreq[d] /= self.maxFreq
-
-        self.data.append(dataFreq)
-        self.setRange(data)
-        self.axes.append(axis)
-        if len(dataFreq) > self.numClass:
-            self.numClass = len(dataFreq)
-        self.colors.append([r.random(), r.random(), r.random()])
-        del data
-        del dataFreq
+        self.scheduleLine((self, axis), ndata, axis, name)
 
     def setUnit(self, unit):
         """ Set the unit of the axis """
@@ -373,6 +280,10 @@ class LinePlot(oglC.OGLCanvas):
 
     def clearData(self):
         """ Clear the data """
+        # The lines still being computed are not drawn
+        for key in self.pending:
+            bJ.cancel(key)
+        self.pending.clear()
         self.data.clear()
         self.colors.clear()
         self.name.clear()
@@ -475,11 +386,6 @@ class LinePlot(oglC.OGLCanvas):
             for c in label:
                 glutBitmapCharacter(GLUT_BITMAP_HELVETICA_18, ord(c))
 
-    def setName(self, nName):
-        """ Set the name of the variable """
-        assert type(nName) is str, "Incorrect type"
-        self.name.append(nName)
-
     def reDraw(self):
         """ Send an event for drawing """
         wx.PostEvent(self.GetEventHandler(), wx.PyCommandEvent(wx.EVT_PAINT.typeId, self.GetId()))
@@ -531,8 +437,7 @@ class LinePlotWidget(wx.Panel):
 
     def initLP(self):
         """ Initialize the lineplot """
-        self.lp.setName(self.labels[self.axis])
-        self.lp.setData(self.data, self.axis)
+        self.lp.setData(self.data, self.axis, self.labels[self.axis])
         self.lp.setUnit(self.units[self.axis])
 
     def initComboBox(self):
@@ -580,8 +485,7 @@ class LinePlotWidget(wx.Panel):
         selection = self.cb1.GetClientData(self.cb1.GetSelection())
         self.axis = selection.axisNumber
         self.lp.clearData()
-        self.lp.setData(self.data, self.axis)
-        self.lp.setName(self.labels[self.axis])
+        self.lp.setData(self.data, self.axis, self.labels[self.axis])
         self.lp.setUnit(self.units[self.axis])
         self.lp.reDraw()
         self.cbline.Clear()
@@ -599,11 +503,12 @@ class LinePlotWidget(wx.Panel):
         """ When a new line is selected """
         selection = self.cbline.GetClientData(self.cbline.GetSelection())
         axis = selection.axisNumber
-        self.lp.addNewLine(self.data, axis)
-        self.lp.setName(selection.axisName)
-        del data
+        self.lp.addNewLine(self.data, axis, selection.axisName)
+        self.lp.reDraw()
 
     def close(self):
         """ Close all the controls """
+        if self.lp:
+            self.lp.clearData()
         self.DestroyChildren()
         self.lp = None
@@ -54,6 +54,31 @@ class OGLCanvas(glcanvas.GLCanvas):
             self.init = True
         self.OnDraw()
 
+    def DrawMessage(self, message):
+        """
+        Draws 'message' on the center of the canvas, instead of the graph (e.g. while the
+        data of the graph is computed on the background).
+        """
+        glClear(GL_COLOR_BUFFER_BIT)
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadIdentity()
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+        glColor3f(0.3, 0.3, 0.3)
+        width = 0
+        for c in message:
+            width += glutBitmapWidth(GLUT_BITMAP_HELVETICA_18, ord(c))
+        glRasterPos2f(-width / max(self.GetClientSize().width, 1), 0.0)
+        for c in message:
+            glutBitmapCharacter(GLUT_BITMAP_HELVETICA_18, ord(c))
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+        self.SwapBuffers()
+
     def InitGL(self):
         """
         Initialize OpenGL. Abstract method in parent class.
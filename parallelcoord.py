@@ -6,11 +6,56 @@ import wx
 
 import oglCanvas as oglC
 
+import backgroundJobs as bJ
+
+import workerPool as wP
+
+import numpy as np
+
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.GLUT import *
-
-from multiprocessing import Process, Queue, Lock
+# Buffers of vertices on the graphics card
+from OpenGL.arrays import vbo
+
+# Auxiliary functions
+def rasterizePair(counts, width):
+    """ Returns the density of the lines between two axes, as an array of 'width' columns of
+    pixels x the number of classes of the axes: the lines from each class on the left axis
+    (first index of 'counts') to each class on the right one, weighted by their number of rows,
+    are accumulated on the pixel they cross on each column. """
+    numBins = counts.shape[0]
+    density = np.zeros(width * numBins)
+    left, right = np.nonzero(counts)
+    # Center of each column, from 0 on the left axis to 1 on the right one
+    t = (np.arange(width) + 0.5) / width
+    columns = np.arange(width)[:, None] * numBins
+    # A few thousands of lines at a time, to bound the memory
+    step = 4096
+    for start in range(0, len(left), step):
+        l, r = left[start:start + step], right[start:start + step]
+        heights = (1.0 - t)[:, None] * (l + 0.5) + t[:, None] * (r + 0.5)
+        pixels = columns + np.minimum(heights.astype(np.int64), numBins - 1)
+        weights = np.broadcast_to(counts[l, r].astype(np.float64), pixels.shape)
+        density += np.bincount(pixels.ravel(), weights=weights.ravel(), minlength=width * numBins)
+    return density.reshape(width, numBins)
+
+def colormap(density, logScale):
+    """ Returns the colors (RGBA bytes) of the densities: from a light to a dark blue as the
+    density grows, on a linear or a logarithmic scale; white where there are no lines. """
+    maximum = density.max() if density.size else 0.0
+    if maximum <= 0:
+        level = np.zeros(density.shape)
+    elif logScale:
+        level = np.log1p(density) / np.log1p(maximum)
+    else:
+        level = density / maximum
+    light = np.array([0.8, 0.9, 1.0])
+    dark = np.array([0.0, 0.0, 0.5])
+    colors = np.ones(density.shape + (4,))
+    colors[..., :3] = light + level[..., None] * (dark - light)
+    colors[density <= 0, :3] = 1.0
+    return (colors * 255).astype(np.uint8)
 
 class ParallelCoordinates(oglC.OGLCanvas):
     """
@@ -24,7 +69,22 @@ class ParallelCoordinates(oglC.OGLCanvas):
         -axesOrder: The order on which the axes are displayed.
         -filterAxis: The axis to apply the filtering.
         -filterRange: The range to filter
+        -columns: The values of each variable, read on the background.
+        -vertices: The point of each row on each axis, as an array of rows x axes x (x, y), normalized once.
+        -valid: Mask of the rows without missing values.
+        -vertexBuffer, indexBuffer: The vertices, and the pairs of them joined by a line, on the graphics card.
+        -drawCalls: The (first vertex, first index, number of indices) of each draw call of the lines.
+        -density: If the density of the lines is drawn instead of the lines (for large data sets).
+        -logScale: If the density is colored on a logarithmic scale.
+        -pairDensities: The density of the lines between each pair of axes (a, b), a < b, computed once.
+        -densityImage: The colors of the density between the adjacent axes, drawn as a texture.
     """
+    # Number of rows from which the density is drawn by default
+    densityRows = 1 << 18
+    # Classes of each axis, and columns of pixels between two axes, of the density
+    densityBins = 256
+    densityWidth = 256
+
     def __init__(self, parent):
         super(ParallelCoordinates, self).__init__(parent)
 
@@ -35,6 +95,18 @@ class ParallelCoordinates(oglC.OGLCanvas):
         self.axesOrder = []
         self.filterAxis = -1
         self.filterRange = []
+        self.columns = None
+        self.vertices = None
+        self.valid = None
+        self.vertexBuffer = None
+        self.indexBuffer = None
+        self.drawCalls = []
+        self.density = False
+        self.logScale = True
+        self.pairDensities = {}
+        self.densityImage = None
+        self.densityChanged = False
+        self.densityTexture = None
 
     def InitGL(self):
         glClearColor(1.0, 1.0, 1.0, 1)
@@ -57,6 +129,7 @@ class ParallelCoordinates(oglC.OGLCanvas):
         assert newData, "Empty input"
         # Hold a reference for the data
         self.data = newData
+        self.pairDensities = {}
 
         assert self.data, "No data copied"
         if self.labels:
@@ -77,74 +150,200 @@ class ParallelCoordinates(oglC.OGLCanvas):
         # Set the default axes order
         for i in range(self.dimensions):
             self.axesOrder.append(i)
-        self.ComputeRanges()
+        self.loadData()
 
         assert self.labels, "Labels array empty"
         assert len(self.labels) == self.data.dataLength(), "Different number of dimensions"
         assert len(self.axesOrder) == self.dimensions, "The length of the array for the order of axes, must be the same to the number of dimensiones"
 
+    def loadData(self):
+        """ Reads on the background what is drawn: the density of the lines, or the values of the variables """
+        if self.density:
+            self.loadDensities()
+        elif self.columns is None:
+            self.loadColumns()
+
+    def setDensity(self, density):
+        """ Draws the density of the lines (True), or the lines """
+        self.density = density
+        if self.dimensions:
+            self.loadData()
+        # Send event to redraw
+        wx.PostEvent(self.GetEventHandler(), wx.PyCommandEvent(wx.EVT_PAINT.typeId, self.GetId()))
+
+    def setLogScale(self, logScale):
+        """ Colors the density on a logarithmic (True) or a linear scale """
+        self.logScale = logScale
+        self.UpdateDensityImage()
+        # Send event to redraw
+        wx.PostEvent(self.GetEventHandler(), wx.PyCommandEvent(wx.EVT_PAINT.typeId, self.GetId()))
+
+    def getDensityPairs(self):
+        """ Returns the pairs of adjacent axes, each one as (a, b) with a < b """
+        return [tuple(sorted(pair)) for pair in zip(self.axesOrder[:-1], self.axesOrder[1:])]
+
+    def loadDensities(self):
+        """ Computes on the background the density of the lines between the adjacent axes, for the
+        pairs not computed yet """
+        pairs = sorted(set(pair for pair in self.getDensityPairs() if pair not in self.pairDensities))
+        if not pairs:
+            self.UpdateDensityImage()
+            return
+        ranges = self.axesRange if self.axesRange else None
+        rowFilter = None
+        if self.filterAxis > -1:
+            rowFilter = (self.filterAxis, self.filterRange[0], self.filterRange[1])
+        bJ.schedule((self, 'density'), self.computeDensities, (pairs, ranges, rowFilter), self.setDensities)
+
+    def computeDensities(self, pairs, ranges, rowFilter):
+        """ Returns the ranges of the axes and the density of the lines between each pair of axes.
+        The points of the lines on both axes are counted on a 2D histogram, for all the pairs with a
+        single pass over the data; then the lines between the classes are drawn on a grid, one pair
+        on each worker. Run on the background.
+            -ranges: The range of each axis, taken from the statistics if None.
+        """
+        if ranges is None:
+            ranges = []
+            for stats in self.data.getStatistics():
+                minR, maxR = stats.getRange()
+                ranges.append([float(minR), float(maxR)] if np.isfinite([minR, maxR]).all() else [0.0, 0.0])
+        counts = self.data.getPairHistograms(pairs, ranges, self.densityBins, rowFilter)
+        futures = []
+        for k in range(len(pairs)):
+            futures.append(wP.submit(rasterizePair, counts[k], self.densityWidth))
+        return ranges, dict(zip(pairs, wP.gather(futures)))
+
+    def setDensities(self, result):
+        """ Keeps the density of the lines computed, and the ranges of the axes if not known """
+        if not self:
+            # The plot was closed
+            return
+        ranges, densities = result
+        if not self.axesRange:
+            self.axesRange = [list(r) for r in ranges]
+        self.pairDensities.update(densities)
+        self.UpdateDensityImage()
+        # Send event to redraw
+        wx.PostEvent(self.GetEventHandler(), wx.PyCommandEvent(wx.EVT_PAINT.typeId, self.GetId()))
+
+    def UpdateDensityImage(self):
+        """ Joins the density between the adjacent axes, on their order, and colors it. The colors are
+        sent to the graphics card on the next draw. """
+        pairs = list(zip(self.axesOrder[:-1], self.axesOrder[1:]))
+        if not pairs or not all(tuple(sorted(pair)) in self.pairDensities for pair in pairs):
+            # Still being computed
+            return
+        images = []
+        for a, b in pairs:
+            density = self.pairDensities[tuple(sorted((a, b)))]
+            if a > b:
+                # From the right axis to the left one
+                density = density[::-1]
+            # Rows of pixels x columns
+            images.append(density.T)
+        self.densityImage = colormap(np.hstack(images), self.logScale)
+        self.densityChanged = True
+
+    def loadColumns(self):
+        """ Reads on the background the values of all the variables, with a single pass """
+        bJ.schedule(self, self.data.readColumns, (list(range(self.dimensions)),), self.setColumns)
+
+    def setColumns(self, columns):
+        """ Keeps the values of the variables, and computes the ranges """
+        if not self:
+            # The plot was closed
+            return
+        self.columns = columns
+        self.ComputeRanges()
+        self.ComputeVertices()
+        # Send event to redraw
+        wx.PostEvent(self.GetEventHandler(), wx.PyCommandEvent(wx.EVT_PAINT.typeId, self.GetId()))
+
     def ComputeRanges(self):
-        """Computes the range of each axis"""
-        def parallelCompute(data, length, startPosition, endPosition, queue, lock):
-            """ Parallel computation of the ranges """
-            data.setDataSetPosition(int(startPosition))
-            axesRange = []
-            # Initialize the ranges
-            for i in range(length):
-                axesRange.append([float('inf'), -float('inf')]) # [min, max]
-            # Get the ranges
-            j = 0
-            for d in data:
-                for i in range(length):
-                    # The minimum
-                    if d[i] <= axesRange[i][0]:
-                        axesRange[i][0] = d[i]
-                    # The maximum
-                    if d[i] >= axesRange[i][1]:
-                        axesRange[i][1] = d[i]
-                j += 1
-                if j >= (endPosition - startPosition):
-                    break
-
-            lock.acquire()
-            queue.put(axesRange)
-            lock.release()
-            data.close()
+        """Gets the range of each axis from its values"""
         assert self.data, "Data must be initialized"
         assert self.dimensions != 0, "Dimensions must be initialized"
 
         self.axesRange.clear()
-        length = self.data.dataLength()
-        # Parallelism
-        q = Queue()
-        qLock = Lock()
-        nRow = self.data.getNumberRows()
-        p1 = Process(target=parallelCompute, args=(self.data.copy(), length, 0.0, nRow / 3.0, q, qLock))
-        p2 = Process(target=parallelCompute, args=(self.data.copy(), length, nRow / 3.0, (2 * nRow) / 3.0, q, qLock))
-        p3 = Process(target=parallelCompute, args=(self.data.copy(), length, (2 * nRow) / 3.0, nRow, q, qLock))
-        # Compute absolute frequencies
-        # Start threads
-        p1.start()
-        p2.start()
-        p3.start()
-        # Wait for threads
-        p1.join()
-        p2.join()
-        p3.join()
-
-        self.axesRange = q.get()
-        while not q.empty():
-            ranges = q.get()
-            i = 0
-            for axRange in ranges:
-                if axRange[0] < self.axesRange[i][0]:
-                    self.axesRange[i][0] = axRange[0]
-                if self.axesRange[i][1] < axRange[1]:
-                    self.axesRange[i][1] = axRange[1]
-                i += 1
-        self.data.rewind()
+        for column in self.columns:
+            values = column[~np.isnan(column)]
+            if len(values) == 0:
+                self.axesRange.append([0.0, 0.0])
+            else:
+                self.axesRange.append([float(values.min()), float(values.max())])
         assert len(self.axesRange) == self.data.dataLength(), "Incorrect number of ranges " + str(len(self.axesRange)) + " " + str(self.data.dataLength())
 
+    def ComputeVertices(self):
+        """ Maps the values of each axis to the [0, 1] range, for all the rows at once. The vertices
+        are sent to the graphics card when drawing, only when they change. """
+        rows = len(self.columns[0])
+        self.vertices = np.zeros((rows, self.dimensions, 2), dtype=np.float32)
+        self.valid = np.ones(rows, dtype=bool)
+        for index in range(self.dimensions):
+            column = self.columns[index]
+            self.valid &= ~np.isnan(column)
+            minR, maxR = self.axesRange[index]
+            if maxR > minR:
+                self.vertices[:, index, 1] = (column - minR) / (maxR - minR)
+        # The buffer on the graphics card, if any, is replaced by the new vertices (UpdateOrder)
+        self.UpdateOrder()
+
+    def UpdateOrder(self):
+        """ Places the axes in the order of axesOrder: only the x coordinate of the vertices, and
+        which of them are joined, change. For the density, only the new pairs of adjacent axes
+        are computed. """
+        if self.density:
+            self.loadDensities()
+        if self.vertices is None:
+            return
+        spacing = 1.0 / (self.dimensions - 1.0)
+        for i in range(len(self.axesOrder)):
+            self.vertices[:, self.axesOrder[i], 0] = i * spacing
+        if self.vertexBuffer is not None:
+            # Sent again on the next draw
+            self.vertexBuffer.set_array(self.vertices)
+        self.UpdateIndices()
+
+    def UpdateFilter(self):
+        """ Applies the filter to what is drawn: the lines on the range, and the density of them,
+        computed again """
+        self.pairDensities = {}
+        if self.density:
+            self.loadDensities()
+        self.UpdateIndices()
+
+    def UpdateIndices(self):
+        """ Computes the pairs of vertices joined by a line: for each row to draw (those without
+        missing values, and on the filter range), its points on each pair of adjacent axes """
+        if self.vertices is None:
+            return
+        rows = self.valid
+        if self.filterAxis > -1:
+            column = self.columns[self.filterAxis]
+            rows = rows & (self.filterRange[0] <= column) & (column <= self.filterRange[1])
+        rows = np.flatnonzero(rows)
+        pairs = np.array([self.axesOrder[:-1], self.axesOrder[1:]], dtype=np.uint32).T
+        # Rows of each draw call: their vertices are numbered from the first one of the call, so
+        # the indices, and the number of them, fit on 32 bits
+        callRows = min((1 << 32) // self.dimensions, ((1 << 31) - 1) // max(2 * len(pairs), 1))
+        self.drawCalls = []
+        parts = []
+        count = 0
+        for start in range(0, len(self.vertices), callRows):
+            lower, upper = np.searchsorted(rows, [start, start + callRows])
+            if lower == upper:
+                continue
+            # Number of the first vertex of each row, from the first vertex of the call
+            first = ((rows[lower:upper] - start) * self.dimensions).astype(np.uint32)
+            parts.append((first[:, None, None] + pairs[None, :, :]).ravel())
+            self.drawCalls.append((start * self.dimensions, count, len(parts[-1])))
+            count += len(parts[-1])
+        indices = np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint32)
+        if self.indexBuffer is None:
+            self.indexBuffer = vbo.VBO(indices, target=GL_ELEMENT_ARRAY_BUFFER)
+        else:
+            self.indexBuffer.set_array(indices)
+
     def changeAxes(self, axis1, axis2):
         """ Change the position of the axis 1 to the position of the axis 2, and viceversa """
         # Get the position
@@ -158,6 +357,7 @@ class ParallelCoordinates(oglC.OGLCanvas):
         # Change the order
         self.axesOrder[index1] = axis2
         self.axesOrder[index2] = axis1
+        self.UpdateOrder()
         # Send event to redraw
         wx.PostEvent(self.GetEventHandler(), wx.PyCommandEvent(wx.EVT_PAINT.typeId, self.GetId()))
 
@@ -168,6 +368,39 @@ class ParallelCoordinates(oglC.OGLCanvas):
         # Set default
         for i in range(self.dimensions):
             self.axesOrder.append(i)
+        self.UpdateOrder()
+        # Send event to redraw
+        wx.PostEvent(self.GetEventHandler(), wx.PyCommandEvent(wx.EVT_PAINT.typeId, self.GetId()))
+
+    def suggestAxesOrder(self):
+        """ Orders the axes so the most correlated variables are next to each other. Starting
+        with the pair with the strongest correlation (positive or negative), the chain of axes
+        grows at either end with the remaining axis most correlated to that end. The correlations
+        come from the matrix kept by the data, computed on the background with a single pass
+        the first time. """
+        if self.dimensions < 3:
+            return
+        bJ.schedule((self, 'correlations'), self.data.getCorrelations, (), self.setSuggestedOrder)
+
+    def setSuggestedOrder(self, correlations):
+        """ Places the axes in the order suggested by the correlations of the variables """
+        if not self:
+            # The plot was closed
+            return
+        strength = np.nan_to_num(np.abs(correlations), nan=0.0)
+        np.fill_diagonal(strength, -1.0)
+        first, second = np.unravel_index(np.argmax(strength), strength.shape)
+        order = [int(first), int(second)]
+        remaining = [i for i in range(self.dimensions) if i not in order]
+        while remaining:
+            left = strength[order[0], remaining]
+            right = strength[order[-1], remaining]
+            if left.max() > right.max():
+                order.insert(0, remaining.pop(int(np.argmax(left))))
+            else:
+                order.append(remaining.pop(int(np.argmax(right))))
+        self.axesOrder = order
+        self.UpdateOrder()
         # Send event to redraw
         wx.PostEvent(self.GetEventHandler(), wx.PyCommandEvent(wx.EVT_PAINT.typeId, self.GetId()))
 
@@ -184,6 +417,7 @@ class ParallelCoordinates(oglC.OGLCanvas):
         assert self.axesRange[self.filterAxis][0] <= nRange[1] <= self.axesRange[self.filterAxis][1], "Out of range"
 
         self.filterRange = nRange.copy()
+        self.UpdateFilter()
         # Send event to redraw
         wx.PostEvent(self.GetEventHandler(), wx.PyCommandEvent(wx.EVT_PAINT.typeId, self.GetId()))
 
@@ -196,11 +430,18 @@ class ParallelCoordinates(oglC.OGLCanvas):
         """ Resets the class so all lines are drawn """
         self.filterAxis = -1
         self.filterRange = []
+        self.UpdateFilter()
         wx.PostEvent(self.GetEventHandler(), wx.PyCommandEvent(wx.EVT_PAINT.typeId, self.GetId()))
 
     def OnDraw(self):
         """Draw the graph"""
+        if (self.densityImage if self.density else self.columns) is None:
+            # The values are being read
+            self.DrawMessage("Computing...")
+            return
         glClear(GL_COLOR_BUFFER_BIT)
+        if self.density:
+            self.DrawDensity()
 
         # Dotted line
         glPushAttrib(GL_ENABLE_BIT)
@@ -211,8 +452,9 @@ class ParallelCoordinates(oglC.OGLCanvas):
         self.DrawParallelAxes()
         glPopAttrib()
 
-        glColor3f(0.0, 0.0, 1.0)
-        self.DrawLines()
+        if not self.density:
+            glColor3f(0.0, 0.0, 1.0)
+            self.DrawLines()
         glColor3f(0.0, 0, 0)
         self.DrawLabels()
 
@@ -242,45 +484,54 @@ class ParallelCoordinates(oglC.OGLCanvas):
         glEnd()
 
     def DrawLines(self):
-        """Draws the lines representing the data"""
-        def Map(value, Range):
-            """Map the value in range [range[0], range[1]] to the range [0, 1]"""
-            # Formula for mapping [A, B] -> [a, b]:
-            #
-            #   (val - A) * (b - a) / (B - A) + a
-            assert type(value) is (float or int), str(type(value))
-            assert len(Range) > 0
-            unitRange = [0.0, 1.0]
-
-            norm = ((value - Range[0]) * (unitRange[1] - unitRange[0]) / (Range[1] - Range[0])) + unitRange[0]
-            assert unitRange[0] <= norm <= unitRange[1], "Out of range: " + str(norm) + " " + str(Range) + " " + str(value)
-            return norm
-        # def parallelDraw(data, startPosition, endPosition, filterAxis, filterRange)
-        #
+        """Draws the lines representing the data, with a single call (unless the vertices can not
+        be numbered on 32 bits), from the buffers on the graphics card (see ComputeVertices and
+        UpdateIndices)."""
         assert self.data, "Data must be initialized"
-        # assert self.dimensions > 0, "Dimensions must be greater than zero"
         assert self.data.dataLength() == self.dimensions, "Dimensions in data must be the same as in the variable"
         assert len(self.axesRange) > 0, "Range must be initialized"
 
-        spacing = 1.0 / (self.dimensions - 1.0)
-        # Iterate over all rows
-        for row in self.data:
-            i = 0
-            drawLine = True
-            # Check if point is within interval, and a filter must be applied
-            if self.filterAxis > -1:        # If a filter must be applied
-                if not (self.filterRange[0] <= row[self.filterAxis] <= self.filterRange[1]): # If the variable is out of range
-                    drawLine = False
-            if drawLine:
-                glBegin(GL_LINE_STRIP)
-                for index in self.axesOrder:
-                    coord = row[index]
-                    coordNorm = Map(coord, self.axesRange[index])
-                    glVertex3f(i * spacing, coordNorm, 0.0)
-                    i += 1
-                glEnd()
-        self.data.rewind()
-        del row
+        if self.indexBuffer is None or len(self.indexBuffer.data) == 0:
+            return
+        if self.vertexBuffer is None:
+            self.vertexBuffer = vbo.VBO(self.vertices)
+        self.vertexBuffer.bind()
+        self.indexBuffer.bind()
+        glEnableClientState(GL_VERTEX_ARRAY)
+        for firstVertex, firstIndex, count in self.drawCalls:
+            glVertexPointer(2, GL_FLOAT, 0, self.vertexBuffer + firstVertex * self.vertices.itemsize * 2)
+            glDrawElements(GL_LINES, count, GL_UNSIGNED_INT, self.indexBuffer + firstIndex * self.indexBuffer.data.itemsize)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        self.indexBuffer.unbind()
+        self.vertexBuffer.unbind()
+
+    def DrawDensity(self):
+        """Draws the density of the lines, as a texture covering the axes; its size depends on
+        the number of axes, not on the number of rows"""
+        if self.densityTexture is None:
+            self.densityTexture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.densityTexture)
+        if self.densityChanged:
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+            glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+            height, width = self.densityImage.shape[:2]
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, self.densityImage)
+            self.densityChanged = False
+        glColor3f(1.0, 1.0, 1.0)
+        glBegin(GL_QUADS)
+        glTexCoord2f(0.0, 0.0)
+        glVertex3f(0.0, 0.0, 0.0)
+        glTexCoord2f(1.0, 0.0)
+        glVertex3f(1.0, 0.0, 0.0)
+        glTexCoord2f(1.0, 1.0)
+        glVertex3f(1.0, 1.0, 0.0)
+        glTexCoord2f(0.0, 1.0)
+        glVertex3f(0.0, 1.0, 0.0)
+        glEnd()
+        glBindTexture(GL_TEXTURE_2D, 0)
 
     def DrawLabels(self):
         """Print the labels on screen"""
@@ -368,6 +619,8 @@ class PCWidget(wx.Panel):
     def initPC(self):
         """ Initialize the ||-coord """
         self.pc.SetData(self.data)
+        # The lines of large data sets are drawn as a density
+        self.pc.setDensity(self.data.getNumberRows() > self.pc.densityRows)
         self.pc.SetLabels(self.labels)
         
 
@@ -397,6 +650,7 @@ class PCWidget(wx.Panel):
         axis2Label = wx.StaticText(self, -1, "Axis 2:")
         self.changeBtn = wx.Button(self, label="Change axes")
         self.resetBtn = wx.Button(self, label="Reset axes")
+        self.suggestBtn = wx.Button(self, label="Suggest order")
         # Init cbs
         self.initComboBox()
 
@@ -412,10 +666,17 @@ class PCWidget(wx.Panel):
         self.resetFilterBtn = wx.Button(self, label="Reset")
         self.filterBtn = wx.Button(self, label="Filter")
 
+        # For drawing the density of the lines
+        self.densityCheck = wx.CheckBox(self, label="Density")
+        self.densityCheck.SetValue(self.pc.density)
+        self.logCheck = wx.CheckBox(self, label="Log scale")
+        self.logCheck.SetValue(self.pc.logScale)
+
         # Group the buttons
         btnsSizer = wx.BoxSizer(wx.HORIZONTAL)
         btnsSizer.Add(self.resetBtn, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT)
         btnsSizer.Add(self.changeBtn, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT)
+        btnsSizer.Add(self.suggestBtn, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT)
         # Group the combo boxes with its respective labels
         # Combo box 1
         cbSizer1 = wx.BoxSizer(wx.VERTICAL)
@@ -451,12 +712,16 @@ class PCWidget(wx.Panel):
         btnsSizer2 = wx.BoxSizer(wx.HORIZONTAL)
         btnsSizer2.Add(self.resetFilterBtn, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT)
         btnsSizer2.Add(self.filterBtn, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT)
+        densitySizer = wx.BoxSizer(wx.HORIZONTAL)
+        densitySizer.Add(self.densityCheck, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT)
+        densitySizer.Add(self.logCheck, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT)
 
         widgetsSizer.Add(axSizer, 0, wx.ALIGN_CENTER_VERTICAL | wx.EXPAND)
         widgetsSizer.Add(rgSizer, 0, wx.RIGHT | wx.ALIGN_CENTER_VERTICAL | wx.EXPAND)
         widgetsSizer.Add(lowSizer, 0, wx.RIGHT | wx.ALIGN_CENTER_VERTICAL | wx.EXPAND)
         widgetsSizer.Add(upSizer, 0, wx.RIGHT | wx.ALIGN_CENTER_VERTICAL | wx.EXPAND)
         widgetsSizer.Add(btnsSizer2, 0, wx.RIGHT | wx.ALIGN_CENTER_VERTICAL | wx.EXPAND)
+        widgetsSizer.Add(densitySizer, 0, wx.TOP | wx.ALIGN_CENTER_VERTICAL | wx.EXPAND)
 
         # Main sizer
         self.sizer = wx.BoxSizer(wx.HORIZONTAL)
@@ -469,9 +734,12 @@ class PCWidget(wx.Panel):
         # https://wiki.python.org/self.Bind vs. self.button.Bind
         self.changeBtn.Bind(wx.EVT_BUTTON, self.onChangeBtn)
         self.resetBtn.Bind(wx.EVT_BUTTON, self.onResetBtn)
+        self.suggestBtn.Bind(wx.EVT_BUTTON, self.onSuggestBtn)
         self.cb3.Bind(wx.EVT_COMBOBOX, self.onAxisSelected)
         self.filterBtn.Bind(wx.EVT_BUTTON, self.onFilterBtn)
         self.resetFilterBtn.Bind(wx.EVT_BUTTON, self.onResetFilterBtn)
+        self.densityCheck.Bind(wx.EVT_CHECKBOX, self.onDensityCheck)
+        self.logCheck.Bind(wx.EVT_CHECKBOX, self.onLogCheck)
 
     def onChangeBtn(self, event):
         """ Handle the change button click """
@@ -487,8 +755,15 @@ class PCWidget(wx.Panel):
         """ Hangle the reset button click """
         self.pc.setDefaultAxesOrder()
 
+    def onSuggestBtn(self, event):
+        """ Handle the suggest order button click: place the correlated axes next to each other """
+        self.pc.suggestAxesOrder()
+
     def onAxisSelected(self, event):
         """ When an axis is selected, get the range of the corresponding axis """
+        if not self.pc.axesRange:
+            # The values are being read
+            return
         selection = self.cb3.GetClientData(self.cb3.GetSelection())
         # Get the axis number
         self.axis = selection.axisNumber
@@ -527,7 +802,19 @@ class PCWidget(wx.Panel):
         self.tbxUpper.SetValue("")
         self.tbxLower.SetValue("")
 
+    def onDensityCheck(self, event):
+        """ Draw the density of the lines, or the lines """
+        self.pc.setDensity(self.densityCheck.GetValue())
+
+    def onLogCheck(self, event):
+        """ Color the density on a logarithmic or a linear scale """
+        self.pc.setLogScale(self.logCheck.GetValue())
+
     def close(self):
         """ Close all controles """
+        if self.pc:
+            bJ.cancel(self.pc)
+            bJ.cancel((self.pc, 'density'))
+            bJ.cancel((self.pc, 'correlations'))
         self.DestroyChildren()
         self.pc = None
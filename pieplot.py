@@ -21,7 +21,8 @@ import math as m
 
 import sort as s
 
-from multiprocessing import Process, Queue, Lock
+# Computations on the background
+import backgroundJobs as bJ
 
 class PiePlot(oglC.OGLCanvas):
     """
@@ -46,6 +47,8 @@ class PiePlot(oglC.OGLCanvas):
         self.unit = ''
         self.nonDrawn = []
         self.N = 0
+        # If all the values of the variable are missing
+        self.noValues = False
 
     def InitGL(self):
         glClearColor(1.0, 1.0, 1.0, 1)
@@ -62,6 +65,13 @@ class PiePlot(oglC.OGLCanvas):
         glutInit(sys.argv)
 
     def OnDraw(self):
+        if self.noValues:
+            self.DrawMessage("No values to display")
+            return
+        if not self.frequencies:
+            # The frequencies are not computed yet
+            self.DrawMessage("Computing...")
+            return
         glClear(GL_COLOR_BUFFER_BIT)
         self.DrawPie()
         self.SwapBuffers()
@@ -194,57 +204,28 @@ class PiePlot(oglC.OGLCanvas):
         """ Return the data of the clases not drawn on the graph """
         return self.nonDrawn
 
-    def computeFrequencies(self, draw):
-        """ Compute the relative frequencies of the data """
-        def parallelCompute(data, startPosition, endPosition, queue, lock, axis):
-            data.setDataSetPosition(int(startPosition))
-            frequencies = {}
-            total = 0
-            for row in data:
-                d = row[axis]
-                del row
-                frequencies[d] = frequencies.get(d, 0) + 1
-                total += 1
-                if total >= (endPosition - startPosition):
-                    break
-            # Get the lock to write frequencies
-            lock.acquire()
-            queue.put((frequencies, total))
-            lock.release()
-
+    def computeFrequencies(self, onComputed):
+        """ Compute the relative frequencies of the data, on the background; the previous ones
+        are displayed meanwhile. A computation still running for another axis is cancelled.
+            -onComputed: Called with the classes not drawn, the number of rows and the colors
+                         once they are computed.
+        """
         if not (self.data and self.labels):
             return
+        self.noValues = False
+        # Absolute frequencies of each value
+        bJ.schedule(self, self.data.getFrequencies, (self.axis,),
+                    lambda frequencies: self.setFrequencies(frequencies, onComputed))
+
+    def setFrequencies(self, frequencies, onComputed):
+        """ Sets the absolute frequencies computed, and computes the relative ones """
+        if not self:
+            # The plot was closed
+            return
+        self.frequencies = frequencies
+        self.noValues = not frequencies
+        total = sum(self.frequencies.values())
 
-        # Clear any previous values
-        self.frequencies.clear()
-        self.frequencies = {}
-        # Create a queue
-        q = Queue()
-        qLock = Lock()
-        nRow = self.data.getNumberRows()
-        p1 = Process(target=parallelCompute, args=(self.data.copy(), 0.0, nRow / 3.0, q, qLock, self.axis))
-        p2 = Process(target=parallelCompute, args=(self.data.copy(), nRow / 3.0, (2 * nRow) / 3.0, q, qLock, self.axis))
-        p3 = Process(target=parallelCompute, args=(self.data.copy(), (2 * nRow) / 3.0, nRow, q, qLock, self.axis))
-        # Compute absolute frequencies
-        # Start threads
-        p1.start()
-        p2.start()
-        p3.start()
-        # Wait for threads
-        p1.join()
-        p2.join()
-        p3.join()
-
-        total = 0
-        # Get the data from the thread
-        while not q.empty():
-            result = q.get()
-            total += result[1]
-            d = result[0]
-            for key in d:
-                self.frequencies[key] = self.frequencies.get(key, 0) + d[key]
-
-        self.data.rewind()
         # Get the total number of elements
         self.N = total
         # Compute relative frequencies
@@ -270,10 +251,9 @@ class PiePlot(oglC.OGLCanvas):
                 self.nonDrawn.append(sortedFrequencies[i])
         self.frequencies = sortedFrequencies
 
-        # Set drawing event if required
-        if draw:
-            wx.PostEvent(self.GetEventHandler(), wx.PyCommandEvent(wx.EVT_PAINT.typeId, self.GetId()))
-        return self.nonDrawn, self.N, self.colors[:10]  # The first 10 colors
+        # Set drawing event
+        wx.PostEvent(self.GetEventHandler(), wx.PyCommandEvent(wx.EVT_PAINT.typeId, self.GetId()))
+        onComputed(self.nonDrawn, self.N, self.colors[:10])  # The first 10 colors
 
     def drawLabels(self, angle, label, radious, freq):
         """ Draw the labels of the pieplot.
@@ -389,9 +369,22 @@ class PPWidget(wx.Panel):
 
         self.pp.setDescription(self.values, self.names)
         self.pp.setAxis(axis)
-        self.nonDrawn, self.N, self.colors = self.pp.computeFrequencies(False)
+        self.pp.computeFrequencies(self.onFrequencies)
+
+    def onFrequencies(self, nonDrawn, N, colors):
+        """ When the frequencies are computed, list the classes not drawn """
+        if not self:
+            # The widget was closed
+            return
+        self.nonDrawn, self.N, self.colors = nonDrawn, N, colors
         if self.nonDrawn:
+            # https://stackoverflow.com/questions/46818112/how-to-delete-items-on-wx-listctrl-from-another-frame
+            self.lvData.DeleteAllItems()
+            self.lvData.DeleteAllColumns()
             self.initListView()
+            self.sizer1.Show(self.lvData, True)
+        else:
+            self.sizer1.Show(self.lvData, False)
 
     def initListView(self):
         """ Initialize the list view for displaying the missing data """
@@ -468,18 +461,12 @@ class PPWidget(wx.Panel):
             names.append(name)
 
         self.pp.setDescription(values, names)
-        self.nonDrawn, self.N, self.colors = self.pp.computeFrequencies(True)
-        if self.nonDrawn:
-            # https://stackoverflow.com/questions/46818112/how-to-delete-items-on-wx-listctrl-from-another-frame
-            self.lvData.DeleteAllItems()
-            self.lvData.DeleteAllColumns()
-            self.initListView()
-            self.sizer1.Show(self.lvData, True)
-        else:
-            self.sizer1.Show(self.lvData, False)
+        self.pp.computeFrequencies(self.onFrequencies)
 
 
     def close(self):
         """ Close all the controls """
+        if self.pp:
+            bJ.cancel(self.pp)
         self.DestroyChildren()
         self.pp = None
@@ -22,8 +22,11 @@ import math as m
 #
 import numpy as np
 
-# Parallelism
-from multiprocessing import Process, Queue, Lock
+# Co-moments for the correlation
+import columnStats as cS
+
+# Computations on the background
+import backgroundJobs as bJ
 
 class ScatterPlot2D(oglC.OGLCanvas):
     """
@@ -35,15 +38,20 @@ class ScatterPlot2D(oglC.OGLCanvas):
         -axis1Name: The name of the variable for the x-axis (horizontal).
         -axis2Name: The name of the variable for the y-axis (vertical).
         -r: Pearson or correlation coefficient
+        -data: The data set.
+        -values: Array with all the values of each variable already read, by axis number, so
+                 changing the axes does not read the data again.
     """
     def __init__(self, parent):
         super(ScatterPlot2D, self).__init__(parent)
         # List for the points to be displayed. Handles them as if their were 
         # center of a circle
         self.points = []
-        self.data1 = None
-        self.data2 = None
+        self.data = None
+        self.values = {}
         self.range = []
+        # If all the values of a variable are missing
+        self.noValues = False
         self.divisions = 10
         self.axis1Name = ""
         self.axis2Name = ""
@@ -104,10 +112,14 @@ class ScatterPlot2D(oglC.OGLCanvas):
 
         # self.points.clear()
         # self.points = newData
-        self.data1 = newData
-        self.data2 = newData.copy()
-        self.GetRanges()
-        self.computeCorrCoef()
+        if newData is not self.data:
+            self.data = newData
+            self.values = {}
+        # Both variables with a single pass over a projection of the data, if not read before,
+        # on the background
+        self.range.clear()
+        self.noValues = False
+        self.loadAxes([self.axis1, self.axis2], self.onAxesLoaded)
 
         # assert self.points, "Copy not made"
         # assert EqualLenght(self.points), "All rows must be the same length"
@@ -117,6 +129,41 @@ class ScatterPlot2D(oglC.OGLCanvas):
         self.axis1 = axis1
         self.axis2 = axis2
 
+    def loadAxes(self, axes, onLoaded):
+        """ Reads on the background the values of the variables on the list 'axes' that are not
+        already read, then calls onLoaded() on the thread of the GUI """
+        axes = [axis for axis in axes if axis not in self.values]
+        if not axes:
+            onLoaded()
+            return
+        # Reading other axes, chosen before, is cancelled
+        bJ.schedule(self, self.data.readColumns, (axes,), lambda columns: self.setValues(axes, columns, onLoaded))
+
+    def setValues(self, axes, columns, onLoaded):
+        """ Keeps the values read of the variables on the list 'axes' """
+        if not self:
+            # The plot was closed
+            return
+        for axis, values in zip(axes, columns):
+            self.values[axis] = values
+        onLoaded()
+
+    def onAxesLoaded(self):
+        """ When the values of both variables are read: compute the correlation and the ranges """
+        if self.axis1 not in self.values or self.axis2 not in self.values:
+            # The axes changed meanwhile
+            return
+        self.computeCorrCoef()
+        self.GetRanges()
+        self.reDraw()
+
+    def getPoints(self):
+        """ Returns the arrays of x and y values of the rows with both values """
+        x = self.values[self.axis1]
+        y = self.values[self.axis2]
+        valid = ~(np.isnan(x) | np.isnan(y))
+        return x[valid], y[valid]
+
     def setAxesNames(self, axis1Name, axis2Name):
         """ Set the name of the variable of each axis:
             -axis1Name: The name of the first variable (x-axis).
@@ -133,143 +180,31 @@ class ScatterPlot2D(oglC.OGLCanvas):
         self.unit2 = unit2
 
     def GetRanges(self):
-        """Calculate the ranges of each dimension"""
-        def parallelCompute(data1, data2, startPosition, endPosition, q, lock, axis1, axis2):
-            """ Get the ranges in a parallel manner """
-            data1.setDataSetPosition(startPosition)
-            data2.setDataSetPosition(startPosition)
-            minX = minY = float('inf')
-            maxX = maxY = -float('inf')
-            total = 0
-            for p1 in data1:
-                # For the x coordinate
-                if p1[axis1] < minX:
-                    minX = p1[axis1]
-                elif maxX < p1[axis1]:
-                    maxX = p1[axis1]
-
-                # For the y coordinate
-                p2 = next(data2)
-                if p2[axis2] < minY:
-                    minY = p2[axis2]
-                elif maxY < p2[axis2]:
-                    maxY = p2[axis2]
-
-                total += 1
-                if total >= endPosition - startPosition:
-                    break
-                del p1
-                del p2
-            # Put on queue
-            lock.acquire()
-            q.put(([minX, maxX], [minY, maxY]))
-            lock.release()
-        #
+        """Gets the ranges of each dimension from the values of the variables"""
         self.range.clear()
-        #
-        q = Queue()
-        qLock = Lock()
-        nRow = self.data1.getNumberRows()
-        p1 = Process(target=parallelCompute, args=(self.data1.copy(), self.data2.copy(), 0.0, nRow / 3.0, q, qLock, self.axis1, self.axis2))
-        p2 = Process(target=parallelCompute, args=(self.data1.copy(), self.data2.copy(), nRow / 3.0, (2 * nRow) / 3.0, q, qLock, self.axis1, self.axis2))
-        p3 = Process(target=parallelCompute, args=(self.data1.copy(), self.data2.copy(), (2 * nRow) / 3.0, nRow, q, qLock, self.axis1, self.axis2))
-        # Compute absolute frequencies
-        # Start threads
-        p1.start()
-        p2.start()
-        p3.start()
-        # Wait for thread
-        p1.join()
-        p2.join()
-        p3.join()
-
-        minX = minY = float('inf')
-        maxX = maxY = -float('inf')
-        while not q.empty():
-            result = q.get()
-            rangeX = result[0]
-            rangeY = result[1]
-            if rangeX[0] < minX:
-                minX = rangeX[0]
-            if rangeX[1] > maxX:
-                maxX = rangeX[1]
-            if rangeY[0] < minY:
-                minY = rangeY[0]
-            if rangeY[1] > maxY:
-                maxY = rangeY[1]
-
+        x = self.values[self.axis1]
+        y = self.values[self.axis2]
+        x = x[~np.isnan(x)]
+        y = y[~np.isnan(y)]
+        self.noValues = len(x) == 0 or len(y) == 0
+        if self.noValues:
+            # All the values of a variable are missing: the range is left empty
+            return
+        minX, maxX = float(x.min()), float(x.max())
+        minY, maxY = float(y.min()), float(y.max())
         self.range.append([minX, maxX])
         self.range.append([minY, maxY])
-        self.data1.rewind()
-        self.data2.rewind()
 
         assert minX < maxX, "Incorrect x min and max " + str(minX) + " " + str(maxX)
-        assert minY < maxY, "Incorrect y min and max " + + str(minY) + " " + str(maxy)
+        assert minY < maxY, "Incorrect y min and max " + str(minY) + " " + str(maxY)
         assert self.range, "Not initialized range array"
 
     def computeCorrCoef(self):
         """ Computes the correlation coeficient of the data, also known as 
             Pearson coeficient. """
-        def parallelCompute(data1, data2, startPosition, endPosition, queue, lock, axis1, axis2):
-            """ Compute the correlation coefficiente """
-            data1.setDataSetPosition(int(startPosition))
-            data2.setDataSetPosition(int(startPosition))
-            sumX = 0.0
-            sumY = 0.0
-            sumXY = 0.0
-            sumX2 = 0.0
-            sumY2 = 0.0
-            # N = len(self.points[0])
-            N = 0
-            # Compute sumations
-            for xrow in data1:
-                yrow = next(data2)
-                x = xrow[axis1]
-                y = yrow[axis2]
-                del xrow
-                del yrow
-                sumX += x
-                sumY += y
-                sumXY += x * y
-                sumX2 += x ** 2
-                sumY2 += y ** 2
-                N += 1
-                if N >= (endPosition - startPosition):
-                    break
-            numerator = sumXY - ((sumX * sumY) / N)
-            firstDen = sumX2 - ((sumX ** 2) / N)
-            secondDen = sumY2 - ((sumY ** 2) / N)
-            denominator = m.sqrt(firstDen * secondDen)
-            lock.acquire()
-            queue.put([numerator, denominator])
-            lock.release()
-        #
-        q = Queue()
-        qLock = Lock()
-        nRow = self.data1.getNumberRows()
-        p1 = Process(target=parallelCompute, args=(self.data1.copy(), self.data2.copy(), 0.0, nRow / 3.0, q, qLock, self.axis1, self.axis2))
-        p2 = Process(target=parallelCompute, args=(self.data1.copy(), self.data2.copy(), nRow / 3.0, (2 * nRow) / 3.0, q, qLock, self.axis1, self.axis2))
-        p3 = Process(target=parallelCompute, args=(self.data1.copy(), self.data2.copy(), (2 * nRow) / 3.0, nRow, q, qLock, self.axis1, self.axis2))
-        # Compute absolute frequencies
-        # Start threads
-        p1.start()
-        p2.start()
-        p3.start()
-        # Wait for thread
-        p1.join()
-        p2.join()
-        p3.join()
-        
-        numerator = 0
-        denominator = 0
-        while not q.empty():
-            result = q.get()
-            numerator += result[0]
-            denominator += result[1]
-        
-        self.r = numerator / denominator
-        self.data1.rewind()
-        self.data2.rewind()
+        moments = cS.CoMoments()
+        moments.update(self.values[self.axis1], self.values[self.axis2])
+        self.r = moments.correlation()
 
     def SetDivisionNumber(self, nDiv):
         """Stablishes the number of divions on the grid.
@@ -290,6 +225,13 @@ class ScatterPlot2D(oglC.OGLCanvas):
         self.square = [[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [1.0, 1.0, 0.0]]
 
     def OnDraw(self):
+        if self.noValues:
+            self.DrawMessage("No values to display")
+            return
+        if not self.range:
+            # The values are being read
+            self.DrawMessage("Computing...")
+            return
         glClear(GL_COLOR_BUFFER_BIT)
         self.DrawGrid()
         self.DrawPoints()
@@ -299,37 +241,19 @@ class ScatterPlot2D(oglC.OGLCanvas):
 
     def DrawPoints(self, r = 0.01):
         """Draws the points of the plot"""
-        def Map(value, Range):
-            """Map the value in range [range[0], range[1]] to the range [0, 1]"""
-            # Formula for mapping [A, B] -> [a, b]:
-            #
-            #   (val - A) * (b - a) / (B - A) + a
-            assert type(value) is (float or int), str(type(value))
-            assert len(Range) > 0
-            unitRange = [0.0, 1.0]
-
-            norm = ((value - Range[0]) * (unitRange[1] - unitRange[0]) / (Range[1] - Range[0])) + unitRange[0]
-            assert unitRange[0] <= norm <= unitRange[1], "Out of range: " + str(norm) + " " + str(Range) + " " + str(value)
-            return norm
-
         assert self.range, "Ranges must exists"
 
         # if not self.points:
         #     return
         glColor3f(0.1411, 0.1411, 0.561)
-        for xrow in self.data1:
-            yrow = next(self.data2)
-            x1 = xrow[self.axis1]
-            y1 = yrow[self.axis2]
-            del xrow
-            del yrow
-            # Normalize x
-            x = Map(x1, self.range[0])
-            # Normalize y
-            y = Map(y1, self.range[1])
+        # Normalize all the points at once, only the rows with both values
+        xs, ys = self.getPoints()
+        if self.range[0][1] > self.range[0][0]:
+            xs = (xs - self.range[0][0]) / (self.range[0][1] - self.range[0][0])
+        if self.range[1][1] > self.range[1][0]:
+            ys = (ys - self.range[1][0]) / (self.range[1][1] - self.range[1][0])
+        for x, y in zip(xs.tolist(), ys.tolist()):
             self.DrawPoint(x, y, r)
-        self.data1.rewind()
-        self.data2.rewind()
 
     def DrawGrid(self):
         # Face
@@ -617,5 +541,7 @@ class ScatterplotWidget(wx.Panel):
 
     def close(self):
         """ Close all controls """
+        if self.scp:
+            bJ.cancel(self.scp)
         self.DestroyChildren()
         self.scp = None
@@ -0,0 +1,91 @@
+"""
+Arrays on shared memory (multiprocessing.shared_memory), for sending data to the workers
+and getting results back without pickling. A block is created by one process and attached
+by the others, which see the same memory: the arrays are never copied. Only a descriptor
+of the block (its name and the layout of the arrays) is sent to the workers.
+"""
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Blocks attached by this process, by name, so each one is mapped only once
+attached = {}
+
+class SharedArrays(object):
+    """
+    A block of shared memory containing several arrays.
+        -block: The SharedMemory object.
+        -layout: List of (offset, shape, dtype) of each array.
+        -arrays: The arrays, views of the block.
+        -owner: If this process created the block (and must remove it).
+    """
+    # Alignment of each array on the block
+    alignment = 64
+
+    def __init__(self, block, layout, owner):
+        self.block = block
+        self.layout = layout
+        self.owner = owner
+        self.arrays = [np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf, offset=offset)
+                       for offset, shape, dtype in layout]
+
+    def descriptor(self):
+        """ Returns what another process needs for attaching the block """
+        return (self.block.name, self.layout)
+
+    def close(self):
+        """ Releases the block; the process that created it also removes it """
+        self.arrays = []
+        if self.owner:
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+
+def layoutFor(shapes, dtypes):
+    """ Returns the layout of arrays of the shapes and types, and the size of the block """
+    layout = []
+    size = 0
+    for shape, dtype in zip(shapes, dtypes):
+        size = -(-size // SharedArrays.alignment) * SharedArrays.alignment
+        dtype = np.dtype(dtype)
+        layout.append((size, tuple(shape), dtype.str))
+        size += int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+    return layout, max(size, 1)
+
+def create(arrays):
+    """ Returns a new block with a copy of the arrays """
+    arrays = [np.asarray(array) for array in arrays]
+    layout, size = layoutFor([array.shape for array in arrays], [array.dtype for array in arrays])
+    shared = SharedArrays(shared_memory.SharedMemory(create=True, size=size), layout, True)
+    for i in range(len(arrays)):
+        shared.arrays[i][...] = arrays[i]
+    return shared
+
+def zeros(shapes, dtypes):
+    """ Returns a new block with an array of zeros of each shape and type """
+    layout, size = layoutFor(shapes, dtypes)
+    shared = SharedArrays(shared_memory.SharedMemory(create=True, size=size), layout, True)
+    for array in shared.arrays:
+        array[...] = 0
+    return shared
+
+def attach(descriptor):
+    """ Returns the arrays of a block created by another process, given its descriptor """
+    name, layout = descriptor
+    if name not in attached:
+        # The workers share the resource tracker of the process that created the block,
+        # so the block is still removed only once
+        block = shared_memory.SharedMemory(name=name)
+        attached[name] = SharedArrays(block, layout, False)
+    return attached[name].arrays
+
+def detach(descriptor):
+    """ Unmaps a block attached by this process """
+    shared = attached.pop(descriptor[0], None)
+    if shared is not None:
+        shared.arrays = []
+        try:
+            shared.block.close()
+        except BufferError:
+            # Some view of the arrays is still in use; the block is unmapped once it is released
+            pass
@@ -9,6 +9,8 @@ import wx
 
 import scatterplot_2D as sc
 
+import backgroundJobs as bJ
+
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.GLUT import *
@@ -19,6 +21,7 @@ class SPLOM(sc.ScatterPlot2D):
     It contains the following attributes:
         -data: the data to be plotted on screen.
         -variablesName: Corresponding to each variable.
+        -correlations: Matrix of the correlation coefficients of each pair of variables.
     The data will be passed to the parent class each time the plot has to be painted.
     """
 
@@ -33,6 +36,7 @@ class SPLOM(sc.ScatterPlot2D):
         self.numAxis = 0
         self.xDisplacement = 0.0
         self.yDisplacement = 0.0
+        self.correlations = None
 
     def InitGL(self):
         glClearColor(1.0, 1.0, 1.0, 1)
@@ -54,10 +58,31 @@ class SPLOM(sc.ScatterPlot2D):
 
         self.data = newData
         self.numAxis = newData.dataLength()
+        # The values and the correlations of the variables are computed on the background
+        self.values = {}
+        self.correlations = None
 
         assert self.data, "Data is empty"
         assert self.numAxis > 0, "Number of dimensions must greater than zero"
 
+    def loadValues(self):
+        """ Reads on the background the values of all the numerical variables, with a single pass,
+        and computes the correlations of all the pairs, instead of a pass per cell """
+        bJ.schedule((self, 'correlations'), self.data.getCorrelations, (), self.setCorrelations)
+        self.loadAxes(self.getNumericAxes(), self.reDraw)
+
+    def setCorrelations(self, correlations):
+        """ Keeps the correlations of the variables """
+        if not self:
+            # The plot was closed
+            return
+        self.correlations = correlations
+        self.reDraw()
+
+    def getNumericAxes(self):
+        """ Returns the list of the numerical variables """
+        return [i for i in range(self.numAxis) if self.variablesCategory[i] == 0]
+
     def SetLabels(self, newVarNames):
         """Loads the names of each of the variables to be displayed."""
         assert newVarNames, "Variable name labels cannot be empty"
@@ -91,6 +116,10 @@ class SPLOM(sc.ScatterPlot2D):
         glClear(GL_COLOR_BUFFER_BIT)
         if not self.data:
             return
+        if any(axis not in self.values for axis in self.getNumericAxes()):
+            # The values are being read
+            self.DrawMessage("Computing...")
+            return
         # Change the viewport size in function of the number of numerical variables
         glMatrixMode(GL_PROJECTION)
         glLoadIdentity()
@@ -120,8 +149,6 @@ class SPLOM(sc.ScatterPlot2D):
             # If the variable type is not numeric
             if self.variablesCategory[i] != 0:
                 continue
-            x1 = [x[i] for x in self.data]
-            self.data.rewind()
             k = 1
             for j in range(self.numAxis):
                 # If the variable type is not numeric
@@ -136,9 +163,7 @@ class SPLOM(sc.ScatterPlot2D):
                     k += (numCells - 1)
                     continue
                 # Draw the graphs
-                x2 = [x[j] for x in self.data]
-                self.data.rewind()
-                self.points = [x1, x2]
+                self.setAxes(i, j)
                 self.GetRanges()
                 glPushMatrix()
                 glTranslatef(-cellWidth / 2.0, -cellHeight / 2.0, 0.0)
@@ -146,6 +171,7 @@ class SPLOM(sc.ScatterPlot2D):
                 glScalef(cellWidth, cellHeight, 0.0)
                 self.DrawGrid()
                 self.DrawPoints(0.01)
+                self.DrawCorrelation(i, j)
                 if i == 0:
                     glTranslatef(0.0, 1.1, 0.0)
                     self.DrawRange(self.range[1], 1)
@@ -155,9 +181,7 @@ class SPLOM(sc.ScatterPlot2D):
                 glPopMatrix()
                 # Increas only if the variable is numerical
                 k += (numCells - 1)
-                del x2
             h += (numCells - 1)
-            del x1
 
     def DrawNames(self, i):
         """Draw the names of the variable.
@@ -187,6 +211,19 @@ class SPLOM(sc.ScatterPlot2D):
         for c in label:
             glutBitmapCharacter(GLUT_BITMAP_HELVETICA_12, ord(c))
 
+    def DrawCorrelation(self, i, j):
+        """ Draws the correlation coefficient of the variables i and j on the top of the cell """
+        if self.correlations is None:
+            return
+        r = self.correlations[i][j]
+        if r != r:
+            # Constant variable, no correlation
+            return
+        glColor3f(0.8, 0.0, 0.0)
+        glRasterPos2f(0.05, 0.92)
+        for c in 'r = {:.2f}'.format(r):
+            glutBitmapCharacter(GLUT_BITMAP_HELVETICA_10, ord(c))
+
     def DrawRange(self, Range, orientation):
         """ Draw the values of each axes. 
                 -Range: the range of the variable.
@@ -247,6 +284,7 @@ class SPLOMWidget(wx.Panel):
         self.splom.SetData(self.data)
         self.splom.SetLabels(self.labels)
         self.splom.SetCategory(self.category)
+        self.splom.loadValues()
 
     def groupCtrls(self):
         self.sizer = wx.BoxSizer(wx.HORIZONTAL)
@@ -255,5 +293,8 @@ class SPLOMWidget(wx.Panel):
 
     def close(self):
         """ Close all controls """
+        if self.splom:
+            bJ.cancel(self.splom)
+            bJ.cancel((self.splom, 'correlations'))
         self.DestroyChildren()
         self.splom = None
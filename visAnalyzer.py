@@ -26,6 +26,10 @@ import dataStreaming as dS
 import dataIterator as dI
 # Information bar
 import infoBar
+# Workers for the computations
+import workerPool as wP
+# Computations on the background
+import backgroundJobs as bJ
 
 import random as r
 
@@ -153,13 +157,16 @@ class mainGUI(wx.Frame):
 
     def OnDBSelected(self, event):
         """ Displays the available mysql databases and loads the selected one """
+        missingValues = self.AskMissingValues(dI.Data.defaultMissingValues)
+        if missingValues is None:
+            return
         if self.data:
             self.data.close()
             self.hidePlots()
 
         with dbD.GetDBDialog(self, "Connect to a database") as dlg:
             # Indicate the iterator to load a db
-            self.data = dI.Data(0)
+            self.data = dI.Data(0, missingValues)
             # Get the data until a connection to the db is successfully established, or the user canceled
             while True:
                 if dlg.ShowModal() == wx.ID_OK:
@@ -187,12 +194,17 @@ class mainGUI(wx.Frame):
         # Show dialog, if the "ok" button is pressed, open the file
         if dlg.ShowModal() == wx.ID_OK:
             path = dlg.GetPath()
+            # By default, the values used the last time the file was loaded
+            missingValues = self.AskMissingValues(dI.storedMissingValues(path) or dI.Data.defaultMissingValues)
+            if missingValues is None:
+                dlg.Destroy()
+                return
             if self.data:
                 self.data.close()
                 self.hidePlots()
             self.labels = []
             self.category = []
-            self.data = dI.Data(1)
+            self.data = dI.Data(1, missingValues)
             r = self.data.loadCSV(path)
             if not r:   # File not loaded
                 wx.MessageBox("Unable to find description file", "No description file found")
@@ -296,6 +308,17 @@ class mainGUI(wx.Frame):
             return False
         return True
 
+    def AskMissingValues(self, values):
+        """ Asks for the values that mark a missing value on the data (e.g. -9 on the heart
+        disease data), starting with 'values'. Returns the list of values, or None if canceled. """
+        dlg = wx.TextEntryDialog(self, "Values that mark a missing value, separated by commas:",
+                                 "Missing values", ", ".join(values))
+        missingValues = None
+        if dlg.ShowModal() == wx.ID_OK:
+            missingValues = [value.strip() for value in dlg.GetValue().split(',')]
+        dlg.Destroy()
+        return missingValues
+
     def GetSelectedAxis(self, selectionable, title="", text=""):
         """ Returns the index of the axis selected.
             -selectionable: List of selectionable axes.
@@ -486,3 +509,6 @@ class visAnalyzer(wx.App):
 if __name__ == '__main__':
     app = visAnalyzer(False)
     app.MainLoop()
+    # Stop the jobs and the workers
+    bJ.shutdown()
+    wP.shutdown()
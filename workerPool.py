@@ -0,0 +1,96 @@
+"""
+A pool of worker processes shared by all the plots. The processes are started the first
+time a task is submitted and kept alive afterwards, so a recomputation (e.g. moving the
+slider of the histogram) only pays for the scan of the data, not for creating processes.
+The tasks are module level functions; their arguments and results are sent by pickling.
+A thread waiting for tasks can be given a flag (a threading.Event); once it is set, the
+wait is abandoned, the tasks not started are cancelled and Cancelled is raised.
+"""
+import os
+import threading
+import multiprocessing as mp
+import concurrent.futures as cf
+from multiprocessing import resource_tracker
+
+# The pool, None until it is needed
+executor = None
+executorLock = threading.Lock()
+
+# Flag of cancellation of the computation run by each thread
+local = threading.local()
+
+# Seconds between checks of the flag of cancellation while waiting
+pollInterval = 0.05
+
+class Cancelled(Exception):
+    """ Raised on a thread whose computation was cancelled """
+    pass
+
+def setCancelFlag(flag):
+    """ Sets the flag (threading.Event, or None) of cancellation of the computation of this thread """
+    local.cancelFlag = flag
+
+def checkCancelled():
+    """ Raises Cancelled if the computation of this thread was cancelled """
+    flag = getattr(local, 'cancelFlag', None)
+    if flag is not None and flag.is_set():
+        raise Cancelled()
+
+def getNumberWorkers():
+    """ Returns the number of processes of the pool: the number of cores this process can use """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def getExecutor():
+    """ Returns the pool, starting it if needed """
+    global executor
+    with executorLock:
+        if executor is None:
+            # The workers share the resource tracker of this process, so a block of shared memory
+            # attached by a worker is not removed when the worker stops
+            resource_tracker.ensure_running()
+            # The workers are forked, so they do not import the modules again; they do not inherit
+            # the flag of cancellation of the thread that starts them
+            executor = cf.ProcessPoolExecutor(max_workers=getNumberWorkers(), mp_context=mp.get_context('fork'),
+                                              initializer=setCancelFlag, initargs=(None,))
+        return executor
+
+def submit(function, *args):
+    """ Runs function(*args) on a worker. Returns a concurrent.futures.Future for the result. """
+    global executor
+    try:
+        return getExecutor().submit(function, *args)
+    except cf.process.BrokenProcessPool:
+        # A worker died, start the pool again
+        with executorLock:
+            executor = None
+        return getExecutor().submit(function, *args)
+
+def gather(futures):
+    """ Waits for the futures, and returns the list of their results in the same order. If the
+    computation of this thread is cancelled meanwhile, the futures not started are cancelled
+    (those running finish on their own, their results are discarded). """
+    results = []
+    try:
+        for future in futures:
+            while True:
+                checkCancelled()
+                try:
+                    results.append(future.result(timeout=pollInterval))
+                    break
+                except cf.TimeoutError:
+                    pass
+    except Cancelled:
+        for future in futures:
+            future.cancel()
+        raise
+    return results
+
+def shutdown():
+    """ Stops the workers """
+    global executor
+    with executorLock:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+            executor = None